@@ -0,0 +1 @@
+"""Benchmarks of the hot paths of jutils, run them with python -m benchmarks."""
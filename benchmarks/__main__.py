@@ -0,0 +1,97 @@
+"""
+Runs the benchmarks and writes their results as JSON, optionally comparing them with a previous run:
+
+    python -m benchmarks --quick --output results.json
+    python -m benchmarks --compare results.json --threshold 1.2
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+from importlib.metadata import PackageNotFoundError, version
+
+from benchmarks import bench_procesos, bench_visual
+
+SUITES = {'procesos': bench_procesos, 'visual': bench_visual}
+
+
+def environment() -> dict:
+    versions = {}
+    for package in ['numpy', 'pandas', 'plotly', 'joblib', 'pyarrow']:
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            versions[package] = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'versions': versions
+    }
+
+
+def run(suites: list, quick: bool, max_rows: int = None) -> list:
+    results = []
+    for name in suites:
+        for benchmark in SUITES[name].BENCHMARKS:
+            kwargs = {'max_rows': max_rows} if name == 'visual' else {}
+            for record in benchmark(quick, **kwargs):
+                print(f"{record['benchmark']:<32} {json.dumps(record['params']):<36} "
+                      f"median {record['median'] * 1e3:10.3f} ms", flush=True)
+                results.append(record)
+    return results
+
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    """
+    Benchmarks whose median is more than threshold times the median of the baseline.
+    """
+    previous = {(record['benchmark'], json.dumps(record['params'], sort_keys=True)): record for record in baseline}
+    regressions = []
+    for record in results:
+        before = previous.get((record['benchmark'], json.dumps(record['params'], sort_keys=True)))
+        if before is None or before['median'] == 0:
+            continue
+        ratio = record['median'] / before['median']
+        if ratio > threshold:
+            regressions.append({'benchmark': record['benchmark'], 'params': record['params'], 'ratio': ratio})
+    return regressions
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmarks of jutils.')
+    parser.add_argument('--suite', choices=list(SUITES), action='append', help='Suites to run, by default all.')
+    parser.add_argument('--quick', action='store_true', help='Smaller sizes, for a quick check.')
+    parser.add_argument('--max-rows', type=int, default=None, help='Max rows of the visual benchmarks.')
+    parser.add_argument('--output', help='JSON file where the results are written.')
+    parser.add_argument('--compare', help='JSON file of a previous run to compare with.')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Ratio of the medians above which a benchmark is a regression.')
+    args = parser.parse_args(argv)
+
+    report = {'environment': environment(), 'results': run(args.suite or list(SUITES), args.quick, args.max_rows)}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(report['results'], json.load(file)['results'], args.threshold)
+        for regression in regressions:
+            print(f"Regression {regression['benchmark']} {json.dumps(regression['params'])}: "
+                  f"{regression['ratio']:.2f}x", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
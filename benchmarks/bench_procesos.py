@@ -0,0 +1,107 @@
+"""
+Benchmarks of jutils.procesos: overhead of a chain of steps, latency of the cache hits and throughput of
+Proceso.save_cache and Proceso.from_cache as the state of the steps grows.
+"""
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.common import result, timeit
+from jutils.cache import CacheStore
+from jutils.procesos import Paso, Proceso
+
+MB = 2 ** 20
+
+
+class Identidad(Paso):
+    def _run(self, **kwargs) -> dict:
+        return {'valor': next(iter(kwargs.values()))}
+
+
+class Arreglo(Paso):
+    def __init__(self, nombre, paso_anterior=None, cache=None, megas=1):
+        super().__init__(nombre, paso_anterior, cache)
+        self.megas = megas
+
+    def _run(self, **kwargs) -> dict:
+        return {'valor': np.ones(self.megas * MB // 8)}
+
+
+def cadena(largo: int, cache=None):
+    pasos = [Identidad('paso0', cache=cache)]
+    for numero in range(1, largo):
+        pasos.append(Identidad(f'paso{numero}', pasos[-1], cache=cache))
+    return pasos
+
+
+def chain_overhead(quick: bool):
+    """
+    Time of running a chain of trivial steps from scratch and of running each step when all of them are already in
+    memory, run returns at the last step without visiting the others so every step is run on its own.
+    """
+    # Paso.run recurses once per step, longer chains hit the recursion limit.
+    for largo in [10, 100] if quick else [10, 100, 250]:
+        timing = timeit(lambda pasos: pasos[-1].run(valor=1), setup=lambda: cadena(largo))
+        yield result('procesos.chain_overhead', {'steps': largo, 'state': 'cold'}, timing,
+                     per_step=timing['median'] / largo)
+        pasos = cadena(largo)
+        pasos[-1].run(valor=1)
+        timing = timeit(lambda: [paso.run(valor=1) for paso in pasos], repeat=50)
+        yield result('procesos.chain_overhead', {'steps': largo, 'state': 'memory'}, timing,
+                     per_step=timing['median'] / largo)
+
+
+def cache_hit_latency(quick: bool):
+    """
+    Time of a step found in its CacheStore by a new instance, which computes the key, checks the store and loads the
+    result memory mapped.
+    """
+    with tempfile.TemporaryDirectory() as carpeta:
+        store = CacheStore(carpeta)
+        for megas in [1, 16] if quick else [1, 16, 256]:
+            Arreglo('arreglo', cache=store, megas=megas).run(n=1)
+
+            def leer(paso):
+                return paso.run(n=1)['valor'][-1]
+
+            timing = timeit(leer, setup=lambda: Arreglo('arreglo', cache=store, megas=megas), repeat=20)
+            yield result('procesos.cache_hit_latency', {'mb': megas}, timing)
+        for largo in [10, 100]:
+            cadena(largo, store)[-1].run(valor=1)
+            timing = timeit(lambda pasos: pasos[-1].run(valor=1), setup=lambda: cadena(largo, store), repeat=20)
+            yield result('procesos.cache_hit_latency', {'steps': largo}, timing)
+
+
+def save_cache_throughput(quick: bool):
+    """
+    Throughput of Proceso.save_cache with every result new and of Proceso.from_cache reading every result back, as the
+    size of the results grows.
+    """
+    sizes = [(4, 1), (4, 16)] if quick else [(4, 1), (4, 16), (4, 128), (16, 32)]
+    for pasos, megas in sizes:
+        total = pasos * megas
+        with tempfile.TemporaryDirectory() as carpeta:
+            cache_path = Path(carpeta).joinpath('proceso.pkl')
+
+            def proceso_ejecutado():
+                proceso = Proceso(cached=True, cache_path=cache_path)
+                proceso.pasos = [Arreglo(f'arreglo{numero}', megas=megas) for numero in range(pasos)]
+                for paso in proceso.pasos:
+                    paso.run(n=1)
+                return proceso
+
+            timing = timeit(lambda proceso: proceso.save_cache(), setup=proceso_ejecutado, repeat=3)
+            yield result('procesos.save_cache', {'steps': pasos, 'mb_per_step': megas}, timing,
+                         mb_per_second=total / timing['median'])
+
+            def cargar():
+                proceso = Proceso.from_cache(None, True, cache_path)
+                return sum(float(paso.respuesta['valor'].sum()) for paso in proceso.pasos)
+
+            timing = timeit(cargar, repeat=3)
+            yield result('procesos.from_cache', {'steps': pasos, 'mb_per_step': megas}, timing,
+                         mb_per_second=total / timing['median'])
+
+
+BENCHMARKS = [chain_overhead, cache_hit_latency, save_cache_throughput]
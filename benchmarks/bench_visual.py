@@ -0,0 +1,50 @@
+"""
+Benchmarks of jutils.visual.Plot from 1e4 to 1e7 rows: time to build each figure and bytes of the figure serialized
+to JSON, which is what the browser has to receive and render.
+"""
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import result, timeit
+from jutils.visual import Plot
+
+
+def datos(filas: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'category1': rng.choice(['F', 'M'], filas),
+        'category2': rng.choice(['A', 'B', 'C'], filas),
+        'value1': rng.integers(-1200, 4000, filas),
+        'value2': rng.normal(7500, 1000, filas)
+    })
+
+
+FIGURES = {
+    'heatmap': lambda plot, df: plot.heatmap(df, x='category2', y='category1'),
+    'box': lambda plot, df: plot.box(df, x='category2', y='value1'),
+    'box_numeric_x': lambda plot, df: plot.box(df, x='value1', y='value2'),
+    'histogram': lambda plot, df: plot.histogram(df, x='value1', nbins=50),
+    'histogram_categorical': lambda plot, df: plot.histogram(df, x='category2'),
+    'scatter': lambda plot, df: plot.scatter(df, x='value1', y='value2', color='category2'),
+    'pyramid': lambda plot, df: plot.pyramid(df, x='value1', nbins=6, cat_col='category1', cat1='F', cat2='M')
+}
+
+
+def plot_figures(quick: bool, max_rows: int = None):
+    """
+    Time of building each figure and size of its JSON.
+    """
+    plot = Plot()
+    filas = [10 ** 4, 10 ** 5] if quick else [10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+    for cantidad in filas:
+        if max_rows is not None and cantidad > max_rows:
+            continue
+        df = datos(cantidad)
+        for nombre, figura in FIGURES.items():
+            timing = timeit(lambda: figura(plot, df), repeat=3, budget=10.0)
+            serializada = figura(plot, df).to_json()
+            yield result(f'visual.{nombre}', {'rows': cantidad}, timing, json_bytes=len(serializada))
+            del serializada
+
+
+BENCHMARKS = [plot_figures]
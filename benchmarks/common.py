@@ -0,0 +1,43 @@
+"""
+Utilities shared by the benchmarks.
+"""
+import statistics
+import time
+
+
+def timeit(function, setup=None, repeat: int = 5, budget: float = 5.0) -> dict:
+    """
+    Times function up to repeat times, stopping earlier when the runs add up to budget seconds.
+
+    Args:
+        function (): Function to time, receives the value returned by setup if it is given.
+        setup (): Function called before each run, its time isn't measured.
+        repeat (): Max cant of runs.
+        budget (): Seconds after which no more runs are started.
+
+    Returns:
+        The cant of runs and the min, median, mean and standard deviation of their times in seconds.
+    """
+    times = []
+    while len(times) < repeat and sum(times) < budget:
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        if setup is not None:
+            function(state)
+        else:
+            function()
+        times.append(time.perf_counter() - start)
+    return {
+        'runs': len(times),
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0
+    }
+
+
+def result(name: str, params: dict, timing: dict, **metrics) -> dict:
+    """
+    A record of the results, metrics are derived values like throughput or bytes.
+    """
+    return {'benchmark': name, 'params': params, **timing, **metrics}
@@ -0,0 +1,470 @@
+"""
+Module with an on-disk store for the results of the pipeline steps, addressed by the hash of their inputs.
+"""
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Union
+
+import joblib
+
+
+def atomic_dump(value, path: Path, compress: Union[int, bool, str, tuple] = 0):
+    """
+    Dumps value with joblib into a temporal file next to path and then renames it, so readers see either the
+    previous file or the complete new one.
+    """
+    path = Path(path)
+    descriptor, temporal = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}-', suffix='.tmp')
+    os.close(descriptor)
+    try:
+        joblib.dump(value, temporal, compress=compress)
+        os.replace(temporal, path)
+    except BaseException:
+        os.unlink(temporal)
+        raise
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class FileLock:
+    """
+    Lock shared by the processes that see the same file system, also across nodes. The owner creates the lock file
+    exclusively and writes its lease (pid, host and token) in it, while the lock is held a thread touches the file
+    every lease / 3 seconds. A lock is stale when its owner is a dead process of this host or when it wasn't touched
+    during lease seconds, in that case it is broken and acquired by the next process.
+
+        with FileLock('cache/step.lock'):
+            ...
+    """
+
+    def __init__(self, path: Path, lease: float = 60.0, timeout: float = None, poll: float = 0.05):
+        """
+        Args:
+            path (): Lock file.
+            lease (): Seconds without renewal after which the lock is considered stale.
+            timeout (): Max seconds waiting for the lock, None to wait forever.
+            poll (): Seconds between attempts.
+        """
+        self.path = Path(path)
+        self.lease = lease
+        self.timeout = timeout
+        self.poll = poll
+        self._token = None
+        self._stop = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    @property
+    def locked(self) -> bool:
+        return self._token is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Acquires the lock, if blocking is False returns False instead of waiting when another process holds it.
+        """
+        start = time.monotonic()
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        while not self._try_acquire():
+            if not blocking:
+                return False
+            if self.timeout is not None and time.monotonic() - start > self.timeout:
+                raise TimeoutError(f'Timeout waiting for the lock {self.path}')
+            time.sleep(self.poll)
+        self._stop = threading.Event()
+        threading.Thread(target=self._renew, args=(self._stop,), daemon=True).start()
+        return True
+
+    def release(self):
+        if self._token is None:
+            return
+        self._stop.set()
+        if self._read(self.path).get('token') == self._token:
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+        self._token = None
+
+    def _try_acquire(self) -> bool:
+        token = uuid.uuid4().hex
+        try:
+            descriptor = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return self._break_stale() and self._try_acquire()
+        with os.fdopen(descriptor, 'w') as file:
+            json.dump({'pid': os.getpid(), 'host': socket.gethostname(), 'token': token, 'time': time.time()}, file)
+        self._token = token
+        return True
+
+    def _renew(self, stop: threading.Event):
+        while not stop.wait(self.lease / 3):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                return
+
+    @staticmethod
+    def _read(path: Path) -> dict:
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            # The owner may not have written the lease yet.
+            return {}
+
+    def _stale(self, lease: dict) -> bool:
+        try:
+            touched = self.path.stat().st_mtime
+        except FileNotFoundError:
+            return False
+        if time.time() - touched > self.lease:
+            return True
+        return os.name == 'posix' and lease.get('host') == socket.gethostname() and 'pid' in lease \
+            and not _alive(lease['pid'])
+
+    def _break_stale(self) -> bool:
+        lease = self._read(self.path)
+        if not self._stale(lease):
+            return False
+        # The lock is renamed before deleting it, if another process replaced it meanwhile it is restored.
+        broken = self.path.with_name(f'{self.path.name}.{uuid.uuid4().hex}.stale')
+        try:
+            os.rename(self.path, broken)
+        except FileNotFoundError:
+            return True
+        if self._read(broken).get('token') != lease.get('token'):
+            try:
+                os.link(broken, self.path)
+            except FileExistsError:
+                pass
+        os.unlink(broken)
+        return True
+
+
+POLICIES = ('lru', 'lfu')
+
+
+class CacheStore:
+    """
+    Saves each value with joblib in <path>/<key[:2]>/<key>.joblib. In shared mode the processes that compute the same
+    key coordinate with a FileLock per key, see lock.
+
+    The lookups and saves are appended to <path>/access.log and folded into <path>/index.json, with the hits and last
+    access of each key and the hit, miss and eviction counters of the store. With max_bytes the index also keeps the
+    running total of bytes, updated on each save and delete, and when a save takes it over max_bytes the store evicts
+    entries, the least recently used (lru) or the least frequently used (lfu) first. It can be inspected and pruned
+    from the command line:
+
+        python -m jutils.cache <path> stats
+        python -m jutils.cache <path> prune --max-bytes 10G --policy lfu
+    """
+
+    def __init__(self, path: Path, compress: Union[int, bool, str, tuple] = 0, shared: bool = False,
+                 lease: float = 60.0, timeout: float = None, max_bytes: int = None, policy: str = 'lru'):
+        """
+        Args:
+            path (): Folder of the store.
+            compress (): Compression passed to joblib.dump.
+            shared (): If True the store is used by several processes or nodes and the keys are computed by one of
+                them at a time.
+            lease (): Lease of the locks in seconds, see FileLock.
+            timeout (): Max seconds waiting for a lock.
+            max_bytes (): Bytes of the saved values kept in the store, None for no limit. The values saved by a store
+                without max_bytes are counted in the running total the next time the store is pruned.
+            policy (): 'lru' or 'lfu', the entries evicted first when the store exceeds max_bytes.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f'policy must be one of {POLICIES}, got {policy}')
+        self.path = Path(path)
+        self.compress = compress
+        self.shared = shared
+        self.lease = lease
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.policy = policy
+
+    def __setstate__(self, state):
+        state.setdefault('shared', False)
+        state.setdefault('lease', 60.0)
+        state.setdefault('timeout', None)
+        state.setdefault('max_bytes', None)
+        state.setdefault('policy', 'lru')
+        self.__dict__.update(state)
+
+    def lock(self, key: str) -> FileLock:
+        """
+        Lock of key, held while the value of key is computed and saved.
+        """
+        return FileLock(self.path_for(key).with_suffix('.lock'), self.lease, self.timeout)
+
+    def path_for(self, key: str) -> Path:
+        return self.path.joinpath(key[:2], f'{key}.joblib')
+
+    def contains(self, key: str) -> bool:
+        return self.path_for(key).exists()
+
+    def lookup(self, key: str) -> bool:
+        """
+        Like contains, but records the hit or the miss in the statistics of the store.
+        """
+        found = self.contains(key)
+        self._log('hit' if found else 'miss', key)
+        return found
+
+    def load(self, key: str, mmap_mode: str = None):
+        return joblib.load(self.path_for(key), mmap_mode=mmap_mode)
+
+    def save(self, key: str, value):
+        path = self.path_for(key)
+        path.parent.mkdir(exist_ok=True, parents=True)
+        previous = self._size(key)
+        atomic_dump(value, path, self.compress)
+        self._log('save', key)
+        if self.max_bytes is not None:
+            total = self._add_bytes(path.stat().st_size - previous)
+            if total is None or total > self.max_bytes:
+                self.prune(keep=(key,))
+
+    def delete(self, key: str):
+        size = self._remove(key)
+        if size and self.max_bytes is not None:
+            self._add_bytes(-size)
+
+    def clear(self):
+        if self.path.exists():
+            shutil.rmtree(self.path)
+
+    def entries(self) -> list:
+        """
+        Saved entries with their key, bytes, hits and last access, from the least to the most recently used.
+        """
+        with self._index_lock():
+            index = self._fold()
+        return sorted(self._entries(index), key=lambda entry: entry['last_access'])
+
+    def stats(self) -> dict:
+        """
+        Entries and bytes in the store and the hit, miss and eviction counters since it was created.
+        """
+        with self._index_lock():
+            index = self._fold()
+        entries = self._entries(index)
+        counters = index['counters']
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'entries': len(entries),
+            'bytes': sum(entry['bytes'] for entry in entries),
+            'max_bytes': self.max_bytes,
+            'policy': self.policy,
+            **counters,
+            'hit_rate': counters['hits'] / lookups if lookups else None
+        }
+
+    def prune(self, max_bytes: int = None, policy: str = None, keep: tuple = ()) -> list:
+        """
+        Evicts entries until the store uses at most max_bytes, by default the max_bytes of the store. The entries in
+        keep and the ones locked by a process computing them aren't evicted.
+
+        Returns:
+            The evicted keys.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        policy = policy or self.policy
+        if policy not in POLICIES:
+            raise ValueError(f'policy must be one of {POLICIES}, got {policy}')
+        if max_bytes is None:
+            return []
+        with self._index_lock():
+            index = self._fold()
+            entries = self._entries(index)
+            # Forgets the entries deleted by other means.
+            index['entries'] = {entry['key']: index['entries'][entry['key']] for entry in entries
+                                if entry['key'] in index['entries']}
+            total = sum(entry['bytes'] for entry in entries)
+            if policy == 'lru':
+                order = sorted(entries, key=lambda entry: entry['last_access'])
+            else:
+                order = sorted(entries, key=lambda entry: (entry['hits'], entry['last_access']))
+            evicted = []
+            for entry in order:
+                if total <= max_bytes:
+                    break
+                key = entry['key']
+                if key in keep or self.path_for(key).with_suffix('.lock').exists():
+                    continue
+                self._remove(key)
+                index['entries'].pop(key, None)
+                total -= entry['bytes']
+                evicted.append(key)
+            index['counters']['evictions'] += len(evicted)
+            index['bytes'] = total
+            self._write_index(index)
+        return evicted
+
+    @property
+    def _log_path(self) -> Path:
+        return self.path.joinpath('access.log')
+
+    @property
+    def _index_path(self) -> Path:
+        return self.path.joinpath('index.json')
+
+    def _index_lock(self) -> FileLock:
+        return FileLock(self.path.joinpath('index.lock'), self.lease, self.timeout)
+
+    def _size(self, key: str) -> int:
+        try:
+            return self.path_for(key).stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def _remove(self, key: str) -> int:
+        """
+        Deletes the value of key without updating the index.
+
+        Returns:
+            The bytes it used.
+        """
+        size = self._size(key)
+        try:
+            self.path_for(key).unlink()
+        except FileNotFoundError:
+            return 0
+        return size
+
+    def _add_bytes(self, delta: int) -> Union[None, int]:
+        """
+        Adds delta to the running total of bytes in the index, without folding the log or scanning the entries.
+
+        Returns:
+            The new total, None if the index doesn't have one yet and the entries must be scanned by prune.
+        """
+        with self._index_lock():
+            index = self._read_index()
+            if index.get('bytes') is None:
+                return None
+            index['bytes'] += delta
+            self._write_index(index)
+        return index['bytes']
+
+    def _log(self, kind: str, key: str):
+        # Lines shorter than PIPE_BUF appended with O_APPEND don't interleave between processes.
+        self.path.mkdir(exist_ok=True, parents=True)
+        with open(self._log_path, 'a') as file:
+            file.write(f'{kind} {key} {time.time()}\n')
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self._index_path) as file:
+                index = json.load(file)
+        except FileNotFoundError:
+            index = {}
+        index.setdefault('counters', {'hits': 0, 'misses': 0, 'evictions': 0})
+        index.setdefault('entries', {})
+        return index
+
+    def _write_index(self, index: dict):
+        self.path.mkdir(exist_ok=True, parents=True)
+        descriptor, temporal = tempfile.mkstemp(dir=self.path, prefix='.index-', suffix='.tmp')
+        with os.fdopen(descriptor, 'w') as file:
+            json.dump(index, file)
+        os.replace(temporal, self._index_path)
+
+    def _fold(self) -> dict:
+        """
+        Folds the access log into the index, must be called holding the index lock.
+        """
+        index = self._read_index()
+        if not self._log_path.exists():
+            return index
+        # The log is renamed first, so the processes writing meanwhile start a new one.
+        folding = self.path.joinpath(f'access.{uuid.uuid4().hex}.log')
+        os.rename(self._log_path, folding)
+        with open(folding) as file:
+            for line in file:
+                kind, key, moment = line.split()
+                if kind == 'miss':
+                    index['counters']['misses'] += 1
+                    continue
+                entry = index['entries'].setdefault(key, {'hits': 0, 'last_access': 0.0})
+                entry['last_access'] = max(entry['last_access'], float(moment))
+                if kind == 'hit':
+                    entry['hits'] += 1
+                    index['counters']['hits'] += 1
+        self._write_index(index)
+        os.unlink(folding)
+        return index
+
+    def _entries(self, index: dict) -> list:
+        entries = []
+        for path in self.path.glob('*/*.joblib'):
+            stat = path.stat()
+            entry = index['entries'].get(path.stem, {'hits': 0, 'last_access': stat.st_mtime})
+            entries.append({'key': path.stem, 'bytes': stat.st_size, **entry})
+        return entries
+
+
+def _parse_bytes(value: str) -> int:
+    units = {'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30, 'T': 2 ** 40}
+    value = value.strip().upper().rstrip('B')
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def main(argv: list = None):
+    """
+    Command line to inspect and prune a CacheStore, run python -m jutils.cache --help.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m jutils.cache', description='Inspect and prune a CacheStore.')
+    parser.add_argument('path', type=Path, help='Folder of the store.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help='Entries, bytes and hit, miss and eviction counters.')
+    entries = commands.add_parser('list', help='Entries from the least to the most recently used.')
+    entries.add_argument('--limit', type=int, default=None)
+    prune = commands.add_parser('prune', help='Evict entries until the store fits in max bytes.')
+    prune.add_argument('--max-bytes', type=_parse_bytes, required=True, help='For example 500M or 10G.')
+    prune.add_argument('--policy', choices=POLICIES, default='lru')
+    commands.add_parser('clear', help='Delete the store.')
+    args = parser.parse_args(argv)
+
+    store = CacheStore(args.path)
+    if args.command == 'stats':
+        for name, value in store.stats().items():
+            print(f'{name}: {value}')
+    elif args.command == 'list':
+        print(f'{"key":<32}  {"bytes":>12}  {"hits":>6}  last access')
+        for entry in store.entries()[:args.limit]:
+            moment = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['last_access']))
+            print(f'{entry["key"]:<32}  {entry["bytes"]:>12}  {entry["hits"]:>6}  {moment}')
+    elif args.command == 'prune':
+        evicted = store.prune(args.max_bytes, args.policy)
+        print(f'Evicted {len(evicted)} entries')
+    else:
+        store.clear()
+
+
+if __name__ == '__main__':
+    main()
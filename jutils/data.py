@@ -1,17 +1,87 @@
+import hashlib
+import inspect
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Union, Callable
+from typing import Dict, List, Tuple, Union, Callable, Iterable, Iterator
 from pandas import DataFrame
 import joblib
+import numpy as np
 import pandas as pd
 
+from jutils import dtypes, formats, memory
+from jutils.models import ModelStore
+
+_ARTIFACTS = ('input_data', 'train_test_data', 'validation_data', 'model')
+
+
+def file_fingerprint(path: Path, block_size: int = 1 << 20) -> str:
+    """
+    Hash of the resolved path, size, modification time and content of a file.
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    digest = hashlib.blake2b(f'{path}|{stat.st_size}|{stat.st_mtime_ns}'.encode(), digest_size=16)
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _path_size(path: Path) -> Union[None, int]:
+    path = Path(path)
+    if path.is_file():
+        return path.stat().st_size
+    if path.is_dir():
+        return sum(file.stat().st_size for file in path.rglob('*') if file.is_file())
+    return None
+
+
+def _copy_on_write() -> bool:
+    if int(pd.__version__.split('.')[0]) >= 3:
+        return True
+    try:
+        return pd.get_option('mode.copy_on_write') is True
+    except KeyError:
+        # The option doesn't exist before pandas 1.5.
+        return False
+
+
+def _accepts_pushdown(function: Callable) -> bool:
+    try:
+        parameters = inspect.signature(function).parameters
+    except (TypeError, ValueError):
+        return False
+    if any(parameter.kind == inspect.Parameter.VAR_KEYWORD for parameter in parameters.values()):
+        return True
+    return 'columns' in parameters and 'filters' in parameters
+
 
 class DataUtils:
     def __init__(self,
                  data_folder_path: Path,
                  input_file_name: str,
-                 load_data: Callable[[Path], DataFrame] = lambda input_filepath: pd.read_csv(input_filepath, sep=';'),
-                 save_data: Callable[[DataFrame, Path], None] = lambda df, filepath: df.to_csv(filepath, sep=';',
-                                                                                               index=False)
+                 load_data: Callable[[Path], DataFrame] = formats.read_frame,
+                 save_data: Callable[[DataFrame, Path], None] = formats.write_frame,
+                 interim_format: str = None,
+                 processed_format: str = None,
+                 copy_data: bool = False,
+                 load_chunks: Callable[[Path, int], Iterator[DataFrame]] = formats.read_chunks,
+                 save_chunks: Callable[[Iterable[DataFrame], Path], None] = formats.write_chunks,
+                 parse_cache: bool = False,
+                 parse_cache_path: Path = None,
+                 parse_cache_format: str = '.pkl',
+                 optimize_dtypes: bool = False,
+                 category_threshold: float = 0.5,
+                 columns: list = None,
+                 filters: formats.Filters = None,
+                 model_store: ModelStore = None,
+                 model_name: str = 'model',
+                 model_version: int = None,
+                 hooks: List[Callable[[dict], None]] = None
                  ):
         self.data_folder_path = data_folder_path
         self.input_file_name = input_file_name
@@ -23,6 +93,119 @@ class DataUtils:
         self._model = None
         self.load_data = load_data
         self.save_data = save_data
+        self.interim_format = interim_format
+        self.processed_format = processed_format
+        self.copy_data = copy_data
+        self.load_chunks = load_chunks
+        self.save_chunks = save_chunks
+        self.parse_cache = parse_cache
+        self._parse_cache_path = parse_cache_path
+        self.parse_cache_format = parse_cache_format
+        self.optimize_dtypes = optimize_dtypes
+        self.category_threshold = category_threshold
+        self.dtype_reports = {}
+        self.columns = columns
+        self.filters = filters
+        self._model_store = model_store
+        self.model_name = model_name
+        self.model_version = model_version
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hooks = [] if hooks is None else list(hooks)
+        self._stats: List[dict] = []
+
+    @contextmanager
+    def _measure(self, operation: str, path: Path):
+        """
+        Records the wall time and the file size of an operation, the caller fills rows, columns and memory with
+        _describe. The record is passed to every hook.
+        """
+        record = {'operation': operation, 'path': str(path), 'seconds': None, 'bytes': None, 'rows': None,
+                  'columns': None, 'memory': None}
+        start = time.perf_counter()
+        yield record
+        record['seconds'] = time.perf_counter() - start
+        record['bytes'] = _path_size(record['path'])
+        with self._lock:
+            self._stats.append(record)
+        for hook in self.hooks:
+            hook(record)
+
+    @staticmethod
+    def _describe(record: dict, df: DataFrame):
+        # Shallow memory usage, deep inspection of object columns would cost as much as the load.
+        record['rows'] = (record['rows'] or 0) + len(df)
+        record['columns'] = len(df.columns)
+        record['memory'] = (record['memory'] or 0) + int(df.memory_usage(index=True, deep=False).sum())
+
+    def stats(self) -> DataFrame:
+        """
+        Loads and saves done by this instance, one row for each one with the columns operation, path, seconds,
+        bytes (size of the file), rows, columns and memory (bytes in memory of the frame).
+        """
+        with self._lock:
+            records = list(self._stats)
+        return pd.DataFrame(records, columns=['operation', 'path', 'seconds', 'bytes', 'rows', 'columns', 'memory'])
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = []
+
+    def memory_report(self) -> DataFrame:
+        """
+        Bytes in memory of the loaded frames and the model, memory mapped arrays of the model are included.
+        """
+        with self._lock:
+            artifacts = {'data': self._data, 'input_data': self._input_data,
+                         'train_test_data': self._train_test_data, 'validation_data': self._validation_data,
+                         'model': self._model}
+        rows = []
+        for name, value in artifacts.items():
+            if value is None:
+                continue
+            is_frame = isinstance(value, DataFrame)
+            rows.append({'artifact': name,
+                         'rows': len(value) if is_frame else None,
+                         'columns': len(value.columns) if is_frame else None,
+                         'memory': memory.sizeof(value)})
+        return pd.DataFrame(rows, columns=['artifact', 'rows', 'columns', 'memory'])
+
+    @property
+    def save_data(self) -> Callable[[DataFrame, Path], None]:
+        return self._save_frame
+
+    @save_data.setter
+    def save_data(self, save_data: Callable[[DataFrame, Path], None]):
+        self._save_data = save_data
+
+    def _save_frame(self, df: DataFrame, path: Path):
+        with self._measure('save', path) as record:
+            self._save_data(df, path)
+            self._describe(record, df)
+
+    @property
+    def save_chunks(self) -> Callable[[Iterable[DataFrame], Path], None]:
+        return self._save_chunks_measured
+
+    @save_chunks.setter
+    def save_chunks(self, save_chunks: Callable[[Iterable[DataFrame], Path], None]):
+        self._save_chunks = save_chunks
+
+    def _save_chunks_measured(self, chunks: Iterable[DataFrame], path: Path):
+        with self._measure('save_chunks', path) as record:
+            def described(chunks):
+                for chunk in chunks:
+                    self._describe(record, chunk)
+                    yield chunk
+
+            self._save_chunks(described(chunks), path)
+
+    def _measure_chunks(self, chunks: Iterator[DataFrame], path: Path) -> Iterator[DataFrame]:
+        # The record includes the time spent by the consumer between chunks.
+        with self._measure('load_chunks', path) as record:
+            for chunk in chunks:
+                self._describe(record, chunk)
+                yield chunk
 
     @property
     def X_names(self):
@@ -40,67 +223,387 @@ class DataUtils:
     def data(self, data):
         self._data = data
 
+    @staticmethod
+    def _freeze(df: DataFrame) -> DataFrame:
+        # Marks the numpy buffers of the cached frame as read only, so a view of it can't modify them.
+        for array in df._mgr.arrays:
+            if isinstance(array, np.ndarray):
+                array.flags.writeable = False
+        return df
+
+    def _view(self, df: DataFrame) -> DataFrame:
+        """
+        Returns a full copy of df when copy_data is True, otherwise a shallow copy sharing its read only buffers,
+        with copy on write (pandas >= 3.0) the first write copies the modified columns, in older versions
+        writing the values raises a ValueError. Without copy on write the extension arrays (categorical, nullable,
+        ...) can't be marked read only, those columns are copied.
+        """
+        if self.copy_data:
+            return df.copy()
+        view = df.copy(deep=False)
+        if _copy_on_write():
+            return view
+        for position, dtype in enumerate(df.dtypes):
+            if isinstance(dtype, pd.api.extensions.ExtensionDtype):
+                view[view.columns[position]] = df.iloc[:, position].copy()
+        return view
+
+    def _parse_cache_file(self, path: Path, columns: list = None, filters: formats.Filters = None) -> Path:
+        loader = f'{getattr(self.load_data, "__module__", "")}.{getattr(self.load_data, "__qualname__", "")}'
+        key = f'{Path(path).resolve()}|{loader}|{columns}|{filters}'
+        path_key = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+        suffix = self.parse_cache_format
+        suffix = suffix if suffix.startswith('.') else '.' + suffix
+        # The suffix is appended, with_suffix would replace the key and the fingerprint of stems with dots.
+        return self.parse_cache_path.joinpath(f'{Path(path).stem}-{path_key}-{file_fingerprint(path)}{suffix}')
+
+    def _read(self, path: Path, columns: list = None, filters: formats.Filters = None) -> DataFrame:
+        """
+        Reads path with load_data, columns and filters are pushed down to the reader when it accepts them, otherwise
+        they are applied after reading the whole file.
+        """
+        if columns is None and not filters:
+            return self.load_data(path)
+        if _accepts_pushdown(self.load_data):
+            return self.load_data(path, columns=columns, filters=filters)
+        return formats.select(self.load_data(path), columns, filters)
+
+    def _parse(self, path: Path, columns: list = None, filters: formats.Filters = None) -> DataFrame:
+        """
+        Loads path with load_data, when parse_cache is True the parsed frame is stored in parse_cache_path and
+        reused while the file keeps the same fingerprint, the entries of previous versions of the file are removed.
+        """
+        if not self.parse_cache:
+            return self._read(path, columns, filters)
+        cache_file = self._parse_cache_file(path, columns, filters)
+        if cache_file.exists():
+            return formats.read_frame(cache_file)
+        df = self._read(path, columns, filters)
+        prefix = cache_file.name.rsplit('-', 1)[0]
+        for old_file in cache_file.parent.glob(f'{prefix}-*'):
+            old_file.unlink()
+        cache_file.parent.mkdir(exist_ok=True, parents=True)
+        formats.write_frame(df, cache_file)
+        return df
+
+    def schema_path(self, path: Path) -> Path:
+        """
+        Path of the dtypes schema of a data file, the schemas of the raw files are kept in interim_path.
+        """
+        path = Path(path)
+        if path.parent == self.raw_path:
+            return dtypes.schema_path(self.interim_path.joinpath(path.name))
+        return dtypes.schema_path(path)
+
+    def _optimize(self, path: Path, df: DataFrame) -> DataFrame:
+        """
+        Applies the schema saved for path, or infers and saves it when it doesn't exist or doesn't fit the data
+        anymore. The memory saved by each column is kept in dtype_reports[path].
+        """
+        schema_file = self.schema_path(path)
+        schema = dtypes.load_schema(schema_file) if schema_file.exists() else {}
+        try:
+            optimized = dtypes.apply_schema(df, schema)
+        except (ValueError, TypeError):
+            schema = {}
+        missing = [column for column in df.columns if column not in schema]
+        if missing:
+            # Columns that weren't loaded when the schema was inferred are added to it.
+            schema.update(dtypes.infer_schema(df[missing], self.category_threshold))
+            optimized = dtypes.apply_schema(df, schema)
+            schema_file.parent.mkdir(exist_ok=True, parents=True)
+            dtypes.save_schema(schema, schema_file)
+        self.dtype_reports[path] = dtypes.memory_report(df, optimized)
+        return optimized
+
+    def load(self, path: Path, columns: list = None, filters: formats.Filters = None) -> DataFrame:
+        """
+        Loads a data file applying the parse cache and the dtypes optimization when they are enabled.
+
+        Args:
+            path (): File to load.
+            columns (): Columns to load, if None the columns given to the constructor are used (all by default).
+            filters (): List of (column, operator, value) tuples, only the rows that satisfy all of them are loaded,
+                if None the filters given to the constructor are used.
+
+        Returns:
+            The DataFrame with the data.
+        """
+        columns = self.columns if columns is None else columns
+        filters = self.filters if filters is None else filters
+        with self._measure('load', path) as record:
+            df = self._parse(path, columns, filters)
+            if self.optimize_dtypes:
+                df = self._optimize(path, df)
+            self._describe(record, df)
+        return df
+
+    def _load_artifact(self, name: str):
+        if name == 'input_data':
+            return self._freeze(self.load(self.input_file_path))
+        if name == 'train_test_data':
+            return self._freeze(self.load(self.transformed_train_test_path))
+        if name == 'validation_data':
+            return self._freeze(self.load(self.transformed_validation_path))
+        if self.models_path.is_file() and not self.model_store.versions(self.model_name):
+            # Model saved before the versioned store, kept in place when a model_store was given.
+            with self._measure('load_model', self.models_path) as record:
+                model = joblib.load(self.models_path)
+                record['memory'] = memory.sizeof(model)
+            return model
+        version = self.model_version
+        if version is None:
+            version = self.model_store.latest_version(self.model_name)
+        with self._measure('load_model', self.model_store.version_path(version or 0, self.model_name)) as record:
+            model = self.model_store.load(self.model_name, version)
+            record['memory'] = memory.sizeof(model)
+        return model
+
+    def _resolve(self, name: str, future: Future):
+        try:
+            value = self._load_artifact(name)
+        except BaseException as error:
+            with self._lock:
+                self._pending.pop(name, None)
+            future.set_exception(error)
+            return
+        with self._lock:
+            setattr(self, '_' + name, value)
+            self._pending.pop(name, None)
+        future.set_result(value)
+
+    def _claim(self, name: str):
+        """
+        Returns the loaded artifact, or the future that will hold it and True when the caller has to load it.
+        """
+        if name not in _ARTIFACTS:
+            raise ValueError(f'Unknown artifact {name}, use one of {", ".join(_ARTIFACTS)}')
+        with self._lock:
+            value = getattr(self, '_' + name)
+            if value is not None:
+                return value, None, False
+            future = self._pending.get(name)
+            if future is not None:
+                return None, future, False
+            future = self._pending[name] = Future()
+            return None, future, True
+
+    def _get(self, name: str):
+        """
+        Returns the artifact name, waits for it when it is being loaded by a prefetch or by another thread.
+        """
+        value, future, owner = self._claim(name)
+        if future is None:
+            return value
+        if owner:
+            self._resolve(name, future)
+        return future.result()
+
+    def prefetch_async(self, *names: str) -> Dict[str, Future]:
+        """
+        Starts loading the artifacts at the same time in a thread pool, the properties wait for these loads instead
+        of starting new ones.
+
+        Args:
+            *names (): Artifacts to load, any of input_data, train_test_data, validation_data and model.
+                By default train_test_data, validation_data and model.
+
+        Returns:
+            A dictionary with a future for each artifact.
+        """
+        names = names or ('train_test_data', 'validation_data', 'model')
+        futures = {}
+        executor = None
+        for name in names:
+            value, future, owner = self._claim(name)
+            if future is None:
+                future = Future()
+                future.set_result(value)
+            elif owner:
+                if executor is None:
+                    executor = ThreadPoolExecutor(max_workers=len(names), thread_name_prefix='prefetch')
+                executor.submit(self._resolve, name, future)
+            futures[name] = future
+        if executor is not None:
+            executor.shutdown(wait=False)
+        return futures
+
+    def prefetch(self, *names: str):
+        """
+        Loads the artifacts at the same time and waits for them, raises the first error found.
+        """
+        futures = self.prefetch_async(*names)
+        wait(futures.values())
+        for future in futures.values():
+            future.result()
+
     @property
     def input_data(self) -> DataFrame:
-        if self._input_data is None:
-            self._input_data = self.load_data(self.input_file_path)
-        return self._input_data.copy()
+        return self._view(self._get('input_data'))
 
     @property
     def train_test_data(self) -> DataFrame:
-        if self._train_test_data is None:
-            self._train_test_data = self.load_data(self.transformed_train_test_path)
-        return self._train_test_data.copy()
+        return self._view(self._get('train_test_data'))
 
     @property
     def validation_data(self) -> DataFrame:
-        if self._validation_data is None:
-            self._validation_data = self.load_data(self.transformed_validation_path)
-        return self._validation_data.copy()
+        return self._view(self._get('validation_data'))
+
+    def iter_chunks(self, path: Path, chunksize: int = 100_000, columns: list = None,
+                    filters: formats.Filters = None) -> Iterator[DataFrame]:
+        """
+        Yields the rows of path in DataFrames of at most chunksize rows, columns and filters work as in load.
+        """
+        columns = self.columns if columns is None else columns
+        filters = self.filters if filters is None else filters
+        if columns is None and not filters:
+            chunks = self.load_chunks(path, chunksize)
+        elif _accepts_pushdown(self.load_chunks):
+            chunks = self.load_chunks(path, chunksize, columns=columns, filters=filters)
+        else:
+            chunks = (formats.select(chunk, columns, filters) for chunk in self.load_chunks(path, chunksize))
+        return self._measure_chunks(chunks, path)
+
+    def iter_input_chunks(self, chunksize: int = 100_000) -> Iterator[DataFrame]:
+        return self.iter_chunks(self.input_file_path, chunksize)
+
+    def iter_raw_train_test_chunks(self, chunksize: int = 100_000) -> Iterator[DataFrame]:
+        return self.iter_chunks(self.raw_train_test_path, chunksize)
+
+    def iter_raw_validation_chunks(self, chunksize: int = 100_000) -> Iterator[DataFrame]:
+        return self.iter_chunks(self.raw_validation_path, chunksize)
+
+    def iter_train_test_chunks(self, chunksize: int = 100_000) -> Iterator[DataFrame]:
+        return self.iter_chunks(self.transformed_train_test_path, chunksize)
+
+    def iter_validation_chunks(self, chunksize: int = 100_000) -> Iterator[DataFrame]:
+        return self.iter_chunks(self.transformed_validation_path, chunksize)
+
+    def split_train_validation(self, validation_size: float = 0.2, key: Union[None, str, list] = None,
+                               seed: int = 0, chunksize: int = 100_000) -> Tuple[int, int]:
+        """
+        Reads input_file_path once by chunks and writes each row to raw_train_test_path or raw_validation_path, the
+        memory used is bounded by chunksize.
+
+        Args:
+            validation_size (): Fraction of the rows assigned to validation.
+            key (): Column or columns hashed to assign the rows, the rows with the same key always end in the same
+                file. If None the rows are sampled with seed.
+            seed (): Seed of the sampling when key is None.
+            chunksize (): Cant of rows read at a time.
+
+        Returns:
+            The cant of rows written to train_test and validation.
+        """
+        self.interim_path.mkdir(exist_ok=True, parents=True)
+        rng = np.random.default_rng(seed)
+        train_test_rows, validation_rows = 0, 0
+        with self._measure('split', self.input_file_path) as record, \
+                formats.open_writer(self.raw_train_test_path) as train_test_writer, \
+                formats.open_writer(self.raw_validation_path) as validation_writer:
+            # The whole raw file is split, the columns and filters of the constructor only apply to the loads.
+            chunks = self._measure_chunks(self.load_chunks(self.input_file_path, chunksize), self.input_file_path)
+            for chunk in chunks:
+                self._describe(record, chunk)
+                if key is None:
+                    draws = rng.random(len(chunk))
+                else:
+                    draws = pd.util.hash_pandas_object(chunk[key], index=False).to_numpy() / 2.0 ** 64
+                is_validation = draws < validation_size
+                # Empty slices are only written with the first chunk, so both files exist with their columns.
+                first = train_test_rows + validation_rows == 0
+                if first or not is_validation.all():
+                    train_test_writer.write(chunk.loc[~is_validation])
+                if first or is_validation.any():
+                    validation_writer.write(chunk.loc[is_validation])
+                validation_rows += int(is_validation.sum())
+                train_test_rows += len(chunk) - int(is_validation.sum())
+        return train_test_rows, validation_rows
 
     @property
     def model(self):
-        if self._model is None:
-            self._model = joblib.load(self.models_path)
-        return self._model
+        return self._get('model')
 
     @model.setter
     def model(self, model):
-        joblib.dump(model, self.models_path)
+        with self._measure('save_model', self.models_path) as record:
+            version = self.model_store.save(model, self.model_name)
+            record['path'] = str(self.model_store.version_path(version, self.model_name))
+            record['memory'] = memory.sizeof(model)
+        if self.model_version is not None:
+            # A pinned version follows the model that was just saved.
+            self.model_version = version
+        with self._lock:
+            self._model = model
+
+    @property
+    def model_store(self) -> ModelStore:
+        if self._model_store is None:
+            if self.models_path.is_file():
+                self._migrate_legacy_model()
+            self._model_store = ModelStore(self.models_path)
+        return self._model_store
+
+    def _migrate_legacy_model(self):
+        """
+        Moves the model saved before the versioned store, the file models_path, to the first version of model_name
+        inside the folder models_path.
+        """
+        legacy = self.models_path
+        aside = legacy.with_name(legacy.name + '.legacy')
+        try:
+            os.replace(legacy, aside)
+        except FileNotFoundError:
+            # Moved by another thread or process.
+            return
+        legacy.mkdir(exist_ok=True)
+        os.replace(aside, ModelStore(legacy).version_path(1, self.model_name))
 
     @property
     def input_file_path(self):
         return self.data_folder_path.joinpath('raw', self.input_file_name)
 
+    @staticmethod
+    def _with_format(path: Path, file_format: Union[None, str]) -> Path:
+        if file_format is None:
+            return path
+        return path.with_suffix(file_format if file_format.startswith('.') else '.' + file_format)
+
     @property
     def raw_validation_path(self):
         path = self.data_folder_path.joinpath('interim', self.input_file_name)
-        return path.with_stem(path.stem + '_validation')
+        return self._with_format(path.with_stem(path.stem + '_validation'), self.interim_format)
 
     @property
     def raw_train_test_path(self):
         path = self.data_folder_path.joinpath('interim', self.input_file_name)
-        return path.with_stem(path.stem + '_train_test')
+        return self._with_format(path.with_stem(path.stem + '_train_test'), self.interim_format)
 
     @property
     def transformed_validation_path(self):
         path = self.raw_validation_path.with_stem(self.raw_validation_path.stem + '_processed')
         name = path.name
         parent = path.parent.parent.joinpath('processed')
-        return parent.joinpath(name)
+        return self._with_format(parent.joinpath(name), self.processed_format)
 
     @property
     def transformed_train_test_path(self):
         path = self.raw_train_test_path.with_stem(self.raw_train_test_path.stem + '_processed')
         name = path.name
         parent = path.parent.parent.joinpath('processed')
-        return parent.joinpath(name)
+        return self._with_format(parent.joinpath(name), self.processed_format)
 
     @property
     def models_path(self):
         path = self.data_folder_path.parent.joinpath('models/')
         return path
 
+    @property
+    def parse_cache_path(self):
+        if self._parse_cache_path is not None:
+            return self._parse_cache_path
+        return self.interim_path.joinpath('.parse_cache/')
+
     @property
     def external_path(self):
         return self.data_folder_path.joinpath('external/')
@@ -0,0 +1,112 @@
+"""
+Module with utilities to reduce the memory used by the dtypes of a DataFrame.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Series
+
+_INTEGER_TYPES = ['uint8', 'int8', 'uint16', 'int16', 'uint32', 'int32', 'uint64', 'int64']
+
+
+def _smallest_integer(minimo, maximo, nullable=False) -> str:
+    for dtype in _INTEGER_TYPES:
+        info = np.iinfo(dtype)
+        if info.min <= minimo and maximo <= info.max:
+            return dtype.capitalize().replace('Ui', 'UI') if nullable else dtype
+    return 'Int64' if nullable else 'int64'
+
+
+def infer_dtype(column: Series, category_threshold: float = 0.5) -> str:
+    """
+    Infers the smallest dtype that keeps all the values of column.
+
+    Args:
+        column (): Column to analyze.
+        category_threshold (): Max ratio of unique values over rows to convert a text column to category.
+
+    Returns:
+        The name of the dtype.
+    """
+    dtype = column.dtype
+    non_null = column.dropna()
+    if pd.api.types.is_bool_dtype(dtype) or len(non_null) == 0:
+        return str(dtype)
+    if pd.api.types.is_integer_dtype(dtype):
+        return _smallest_integer(non_null.min(), non_null.max(), nullable=pd.api.types.is_extension_array_dtype(dtype))
+    if pd.api.types.is_float_dtype(dtype):
+        values = non_null.to_numpy(dtype='float64')
+        if np.array_equal(values, np.round(values)) and np.abs(values).max() < 2 ** 53:
+            return _smallest_integer(values.min(), values.max(), nullable=len(non_null) < len(column))
+        if np.array_equal(values.astype('float32').astype('float64'), values):
+            return 'float32'
+        return str(dtype)
+    if pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+        if non_null.nunique() <= category_threshold * len(column):
+            return 'category'
+    return str(dtype)
+
+
+def infer_schema(df: DataFrame, category_threshold: float = 0.5) -> dict:
+    """
+    Returns a dictionary with the smallest dtype for each column of df.
+    """
+    return {column: infer_dtype(df[column], category_threshold) for column in df.columns}
+
+
+def apply_schema(df: DataFrame, schema: dict) -> DataFrame:
+    """
+    Casts the columns of df present in schema, raises ValueError when a value doesn't fit in its integer dtype or
+    isn't a whole number.
+    """
+    casts = {}
+    for column, dtype in schema.items():
+        if column not in df.columns or str(df[column].dtype) == dtype:
+            continue
+        if dtype.lower() in _INTEGER_TYPES:
+            info = np.iinfo(dtype.lower())
+            non_null = df[column].dropna()
+            if len(non_null) and (non_null.min() < info.min or non_null.max() > info.max):
+                raise ValueError(f'The values of {column} do not fit in {dtype}')
+            if pd.api.types.is_float_dtype(non_null.dtype) and (non_null % 1 != 0).any():
+                raise ValueError(f'The values of {column} are not whole numbers, they do not fit in {dtype}')
+        casts[column] = dtype
+    return df.astype(casts) if casts else df
+
+
+def memory_report(before: DataFrame, after: DataFrame) -> DataFrame:
+    """
+    Memory used by each column before and after changing its dtype.
+
+    Returns:
+        A DataFrame indexed by column with the columns dtype_before, dtype_after, bytes_before, bytes_after and
+        bytes_saved.
+    """
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'dtype_after': after.dtypes.astype(str),
+        'bytes_before': before.memory_usage(index=False, deep=True),
+        'bytes_after': after.memory_usage(index=False, deep=True)
+    })
+    report['bytes_saved'] = report['bytes_before'] - report['bytes_after']
+    return report
+
+
+def schema_path(path: Path) -> Path:
+    """
+    Path of the schema sidecar of a data file.
+    """
+    path = Path(path)
+    return path.with_name(path.name + '.schema.json')
+
+
+def save_schema(schema: dict, path: Path):
+    with open(path, 'w') as file:
+        json.dump(schema, file, indent=2)
+
+
+def load_schema(path: Path) -> dict:
+    with open(path) as file:
+        return json.load(file)
@@ -0,0 +1,400 @@
+"""
+Module with the file format registry used by DataUtils to read and write dataframes.
+"""
+import operator
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+Filters = List[Tuple[str, str, Any]]
+
+_OPERATORS = {
+    '==': operator.eq,
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda column, value: column.isin(value),
+    'not in': lambda column, value: ~column.isin(value)
+}
+
+_CSV_FILTER_CHUNKSIZE = 1_000_000
+
+
+class ChunkWriter:
+    """
+    Writes a file one chunk at a time, used as a context manager:
+
+        with open_writer(path) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+
+    The default implementation keeps the chunks in memory and writes them all at close, formats that support
+    appending override it to keep the memory bounded.
+    """
+
+    def __init__(self, path: Path, writer: Callable[[DataFrame, Path], None] = None):
+        self.path = Path(path)
+        self._writer = writer
+        self._chunks = []
+
+    def write(self, df: DataFrame):
+        self._chunks.append(df)
+
+    def close(self):
+        if self._chunks:
+            self._writer(pd.concat(self._chunks, ignore_index=True), self.path)
+            self._chunks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class FileFormat(NamedTuple):
+    """
+    Readers and writers for a file suffix, the readers receive the optional keyword arguments columns and filters.
+    """
+    reader: Callable[..., DataFrame]
+    writer: Callable[[DataFrame, Path], None]
+    chunk_reader: Callable[..., Iterator[DataFrame]]
+    chunk_writer: Callable[[Path], ChunkWriter]
+
+
+_FORMATS: Dict[str, FileFormat] = {}
+
+
+def _normalize_suffix(suffix: str) -> str:
+    suffix = suffix.lower()
+    return suffix if suffix.startswith('.') else '.' + suffix
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError('Columnar formats (parquet, feather, arrow) require pyarrow: pip install pyarrow') \
+            from error
+    return pyarrow
+
+
+def filter_frame(df: DataFrame, filters: Filters = None) -> DataFrame:
+    """
+    Keeps the rows of df that satisfy all the filters.
+
+    Args:
+        df (): Dataframe with the data.
+        filters (): List of (column, operator, value) tuples, the operators are ==, !=, <, <=, >, >=, in and not in.
+
+    Returns:
+        The filtered DataFrame with a new index.
+    """
+    if not filters:
+        return df
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in filters:
+        mask &= pd.Series(_OPERATORS[op](df[column], value)).fillna(False).to_numpy(dtype=bool)
+    return df.loc[mask].reset_index(drop=True)
+
+
+def select(df: DataFrame, columns: list = None, filters: Filters = None) -> DataFrame:
+    """
+    Applies filters to df and then keeps only columns.
+    """
+    df = filter_frame(df, filters)
+    return df if columns is None else df[list(columns)]
+
+
+def _needed_columns(columns: list = None, filters: Filters = None):
+    if columns is None:
+        return None
+    needed = list(columns)
+    for column, _, _ in filters or []:
+        if column not in needed:
+            needed.append(column)
+    return needed
+
+
+def register_format(suffix: str,
+                    reader: Callable[..., DataFrame],
+                    writer: Callable[[DataFrame, Path], None],
+                    chunk_reader: Callable[..., Iterator[DataFrame]] = None,
+                    chunk_writer: Callable[[Path], ChunkWriter] = None,
+                    pushdown: bool = False):
+    """
+    Register the readers and writers used for the files with the given suffix.
+
+    Args:
+        suffix (): File suffix, with or without the leading dot (Ex: '.parquet').
+        reader (): Function that receives a path and returns a DataFrame.
+        writer (): Function that receives a DataFrame and a path and writes the file.
+        chunk_reader (): Function that receives a path and a chunksize and yields DataFrames, if None the file is
+            read with reader and then sliced.
+        chunk_writer (): Function that receives a path and returns a ChunkWriter, if None the chunks are written
+            with writer at close.
+        pushdown (): True if reader and chunk_reader accept the keyword arguments columns and filters, otherwise
+            they are applied to the DataFrames after reading them.
+    """
+    if chunk_reader is None:
+        def chunk_reader(path, chunksize, **kwargs):
+            df = reader(path, **kwargs)
+            for start in range(0, len(df), chunksize):
+                yield df.iloc[start:start + chunksize]
+    elif not pushdown:
+        _chunk_reader = chunk_reader
+
+        def chunk_reader(path, chunksize, columns=None, filters=None):
+            for chunk in _chunk_reader(path, chunksize):
+                yield select(chunk, columns, filters)
+    if not pushdown:
+        _reader = reader
+
+        def reader(path, columns=None, filters=None):
+            return select(_reader(path), columns, filters)
+    if chunk_writer is None:
+        def chunk_writer(path):
+            return ChunkWriter(path, writer)
+    _FORMATS[_normalize_suffix(suffix)] = FileFormat(reader, writer, chunk_reader, chunk_writer)
+
+
+def get_format(path: Path) -> FileFormat:
+    """
+    Returns the format registered for the suffix of path, unknown suffixes are treated as csv.
+    """
+    return _FORMATS.get(_normalize_suffix(Path(path).suffix), _FORMATS['.csv'])
+
+
+def registered_suffixes() -> list:
+    return sorted(_FORMATS)
+
+
+def read_frame(path: Path, columns: list = None, filters: Filters = None) -> DataFrame:
+    """
+    Reads path with the reader registered for its suffix.
+
+    Args:
+        path (): File to read.
+        columns (): Columns to read, None to read all of them.
+        filters (): List of (column, operator, value) tuples, only the rows that satisfy all of them are read.
+
+    Returns:
+        The DataFrame with the data.
+    """
+    return get_format(path).reader(path, columns=columns, filters=filters)
+
+
+def write_frame(df: DataFrame, path: Path):
+    """
+    Writes df to path with the writer registered for its suffix.
+    """
+    get_format(path).writer(df, path)
+
+
+def read_chunks(path: Path, chunksize: int, columns: list = None, filters: Filters = None) -> Iterator[DataFrame]:
+    """
+    Yields the rows of path in DataFrames of at most chunksize rows, columns and filters work as in read_frame.
+    """
+    return get_format(path).chunk_reader(path, chunksize, columns=columns, filters=filters)
+
+
+def open_writer(path: Path) -> ChunkWriter:
+    """
+    Returns a ChunkWriter for path using the writer registered for its suffix.
+    """
+    return get_format(path).chunk_writer(path)
+
+
+def write_chunks(chunks: Iterable[DataFrame], path: Path):
+    """
+    Writes every DataFrame in chunks to path, keeping only one of them in memory when the format supports it.
+    """
+    with open_writer(path) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+
+def _read_csv(path: Path, columns: list = None, filters: Filters = None) -> DataFrame:
+    usecols = _needed_columns(columns, filters)
+    if filters:
+        # Filtering by chunks keeps only the selected rows in memory.
+        with pd.read_csv(path, sep=';', usecols=usecols, chunksize=_CSV_FILTER_CHUNKSIZE) as reader:
+            chunks = [filter_frame(chunk, filters) for chunk in reader]
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.read_csv(path, sep=';', usecols=usecols, nrows=0)
+    else:
+        df = pd.read_csv(path, sep=';', usecols=usecols)
+    return df if columns is None else df[list(columns)]
+
+
+def _write_csv(df: DataFrame, path: Path):
+    df.to_csv(path, sep=';', index=False)
+
+
+def _read_csv_chunks(path: Path, chunksize: int, columns: list = None, filters: Filters = None) -> Iterator[DataFrame]:
+    with pd.read_csv(path, sep=';', usecols=_needed_columns(columns, filters), chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield select(chunk, columns, filters)
+
+
+class _CsvChunkWriter(ChunkWriter):
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self._file = None
+
+    def write(self, df: DataFrame):
+        header = self._file is None
+        if header:
+            self._file = open(self.path, 'w', newline='')
+        df.to_csv(self._file, sep=';', index=False, header=header)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class _ArrowChunkWriter(ChunkWriter, ABC):
+    """
+    Base for the pyarrow writers, the schema of the file is taken from the first chunk with rows, an empty chunk
+    would infer null types for its object columns. When every chunk is empty the first one is written at close.
+    """
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self._pa = _import_pyarrow()
+        self._writer = None
+        self._schema = None
+        self._empty = None
+
+    @abstractmethod
+    def _open(self, schema):
+        pass
+
+    def write(self, df: DataFrame):
+        if self._writer is None and len(df) == 0:
+            if self._empty is None:
+                self._empty = df
+            return
+        table = self._pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        if self._writer is None:
+            self._schema = table.schema
+            self._writer = self._open(self._schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is None and self._empty is not None:
+            table = self._pa.Table.from_pandas(self._empty, preserve_index=False)
+            self._writer = self._open(table.schema)
+            self._writer.write_table(table)
+        self._empty = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class _ParquetChunkWriter(_ArrowChunkWriter):
+    def _open(self, schema):
+        return self._pa.parquet.ParquetWriter(str(self.path), schema)
+
+
+class _IpcChunkWriter(_ArrowChunkWriter):
+    def _open(self, schema):
+        return self._pa.ipc.new_file(str(self.path), schema)
+
+
+def _rebatch(batches, chunksize: int, columns: list = None, filters: Filters = None) -> Iterator[DataFrame]:
+    pa = _import_pyarrow()
+    needed = _needed_columns(columns, filters)
+    pending, rows = [], 0
+    for batch in batches:
+        # RecordBatch.select is missing in older pyarrow versions, Table.select isn't.
+        table = pa.Table.from_batches([batch])
+        pending.append(table if needed is None else table.select(needed))
+        rows += batch.num_rows
+        while rows >= chunksize:
+            table = pa.concat_tables(pending)
+            yield select(table.slice(0, chunksize).to_pandas(), columns, filters)
+            rest = table.slice(chunksize)
+            pending, rows = [rest], rest.num_rows
+    if rows:
+        yield select(pa.concat_tables(pending).to_pandas(), columns, filters)
+
+
+def _read_parquet(path: Path, columns: list = None, filters: Filters = None) -> DataFrame:
+    pa = _import_pyarrow()
+    # pyarrow skips the row groups whose statistics don't match the filters.
+    return pa.parquet.read_table(str(path), columns=columns, filters=filters or None, memory_map=True).to_pandas()
+
+
+def _write_parquet(df: DataFrame, path: Path):
+    pa = _import_pyarrow()
+    pa.parquet.write_table(pa.Table.from_pandas(df, preserve_index=False), str(path))
+
+
+def _read_parquet_chunks(path: Path, chunksize: int, columns: list = None,
+                         filters: Filters = None) -> Iterator[DataFrame]:
+    pa = _import_pyarrow()
+    parquet_file = pa.parquet.ParquetFile(str(path), memory_map=True)
+    for batch in parquet_file.iter_batches(batch_size=chunksize, columns=_needed_columns(columns, filters)):
+        yield select(batch.to_pandas(), columns, filters)
+
+
+def _read_feather(path: Path, columns: list = None, filters: Filters = None) -> DataFrame:
+    pa = _import_pyarrow()
+    table = pa.feather.read_table(str(path), columns=_needed_columns(columns, filters), memory_map=True)
+    return select(table.to_pandas(), columns, filters)
+
+
+def _write_feather(df: DataFrame, path: Path):
+    pa = _import_pyarrow()
+    pa.feather.write_feather(df.reset_index(drop=True), str(path))
+
+
+def _read_arrow(path: Path, columns: list = None, filters: Filters = None) -> DataFrame:
+    pa = _import_pyarrow()
+    needed = _needed_columns(columns, filters)
+    with pa.memory_map(str(path)) as source:
+        table = pa.ipc.open_file(source).read_all()
+        return select((table if needed is None else table.select(needed)).to_pandas(), columns, filters)
+
+
+def _read_arrow_chunks(path: Path, chunksize: int, columns: list = None,
+                       filters: Filters = None) -> Iterator[DataFrame]:
+    pa = _import_pyarrow()
+    with pa.memory_map(str(path)) as source:
+        reader = pa.ipc.open_file(source)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        yield from _rebatch(batches, chunksize, columns, filters)
+
+
+def _write_arrow(df: DataFrame, path: Path):
+    pa = _import_pyarrow()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(str(path), 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _read_pickle(path: Path) -> DataFrame:
+    return pd.read_pickle(path)
+
+
+def _write_pickle(df: DataFrame, path: Path):
+    df.to_pickle(path)
+
+
+register_format('.csv', _read_csv, _write_csv, _read_csv_chunks, _CsvChunkWriter, pushdown=True)
+register_format('.parquet', _read_parquet, _write_parquet, _read_parquet_chunks, _ParquetChunkWriter, pushdown=True)
+register_format('.feather', _read_feather, _write_feather, _read_arrow_chunks, _IpcChunkWriter, pushdown=True)
+register_format('.arrow', _read_arrow, _write_arrow, _read_arrow_chunks, _IpcChunkWriter, pushdown=True)
+register_format('.ipc', _read_arrow, _write_arrow, _read_arrow_chunks, _IpcChunkWriter, pushdown=True)
+register_format('.pkl', _read_pickle, _write_pickle)
@@ -0,0 +1,54 @@
+"""
+Module with utilities to estimate the memory used by python objects.
+"""
+import sys
+
+import numpy as np
+from pandas import DataFrame, Index, Series
+
+
+def sizeof(obj, deep: bool = True) -> int:
+    """
+    Estimates the bytes used by obj, following the containers and the attributes of the objects, counting each
+    object once. Numpy arrays and pandas objects are measured by their buffers.
+
+    Args:
+        obj (): Object to measure.
+        deep (): Passed to the memory_usage of the pandas objects, when False the python objects inside the object
+            columns are not inspected.
+
+    Returns:
+        The estimated size in bytes.
+    """
+    return _sizeof(obj, deep, set())
+
+
+def _sizeof(obj, deep: bool, seen: set) -> int:
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, DataFrame):
+        try:
+            return int(obj.memory_usage(index=True, deep=deep).sum())
+        except ValueError:
+            # pandas < 3.0 can't inspect the read only object columns of the frames cached by DataUtils.
+            size = int(obj.memory_usage(index=True, deep=False).sum())
+            if deep:
+                size += sum(sys.getsizeof(value) for _, column in obj.select_dtypes('object').items()
+                            for value in column)
+            return size
+    if isinstance(obj, (Series, Index)):
+        return int(obj.memory_usage(deep=deep))
+    if isinstance(obj, np.ndarray):
+        # Views are measured by the buffer of their base, so it is counted once.
+        if isinstance(obj.base, np.ndarray):
+            return _sizeof(obj.base, deep, seen)
+        return obj.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_sizeof(key, deep, seen) + _sizeof(value, deep, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_sizeof(item, deep, seen) for item in obj)
+    elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+        size += _sizeof(vars(obj), deep, seen)
+    return size
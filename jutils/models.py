@@ -0,0 +1,112 @@
+"""
+Module with a versioned store for the models saved with joblib.
+"""
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Union
+
+import joblib
+
+
+class ModelStore:
+    """
+    Saves each model as <name>-v<version>.joblib inside path and loads them with joblib, memory mapping their numpy
+    arrays so the processes that load the same version share its pages. The loaded versions are kept in an LRU
+    cache of the current process.
+    """
+
+    def __init__(self, path: Path, compress: Union[int, bool, str, tuple] = 0, mmap_mode: Union[None, str] = 'r',
+                 cache_size: int = 2):
+        """
+        Args:
+            path (): Folder where the models are saved.
+            compress (): Compression passed to joblib.dump, compressed files can't be memory mapped.
+            mmap_mode (): Mode passed to joblib.load, None to read the arrays into memory.
+            cache_size (): Cant of loaded versions kept in memory.
+        """
+        self.path = Path(path)
+        self.compress = compress
+        self.mmap_mode = mmap_mode
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def version_path(self, version: int, name: str = 'model') -> Path:
+        return self.path.joinpath(f'{name}-v{version:04d}.joblib')
+
+    def versions(self, name: str = 'model') -> list:
+        """
+        Saved versions of the model name in ascending order.
+        """
+        if not self.path.is_dir():
+            return []
+        pattern = re.compile(rf'{re.escape(name)}-v(\d+)\.joblib')
+        matches = (pattern.fullmatch(file.name) for file in self.path.iterdir())
+        return sorted(int(match.group(1)) for match in matches if match is not None)
+
+    def latest_version(self, name: str = 'model') -> Union[None, int]:
+        versions = self.versions(name)
+        return versions[-1] if versions else None
+
+    def save(self, model, name: str = 'model', compress: Union[int, bool, str, tuple] = None) -> int:
+        """
+        Saves model as a new version, the file is written with a temporal name and then linked, so other processes
+        never read an incomplete version.
+
+        Returns:
+            The version assigned to the model.
+        """
+        compress = self.compress if compress is None else compress
+        self.path.mkdir(exist_ok=True, parents=True)
+        descriptor, temporal = tempfile.mkstemp(dir=self.path, prefix=f'.{name}-', suffix='.tmp')
+        os.close(descriptor)
+        try:
+            joblib.dump(model, temporal, compress=compress)
+            version = (self.latest_version(name) or 0) + 1
+            while True:
+                try:
+                    os.link(temporal, self.version_path(version, name))
+                    break
+                except FileExistsError:
+                    version += 1
+        finally:
+            os.unlink(temporal)
+        with self._lock:
+            self._remember((name, version), model)
+        return version
+
+    def load(self, name: str = 'model', version: int = None):
+        """
+        Loads a version of the model name, the latest if version is None.
+        """
+        version = self.latest_version(name) if version is None else version
+        if version is None:
+            raise FileNotFoundError(f'There are no versions of {name} in {self.path}')
+        key = (name, version)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        model = joblib.load(self.version_path(version, name), mmap_mode=self.mmap_mode)
+        with self._lock:
+            self._remember(key, model)
+        return model
+
+    def delete(self, version: int, name: str = 'model'):
+        with self._lock:
+            self._cache.pop((name, version), None)
+        self.version_path(version, name).unlink()
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _remember(self, key, model):
+        self._cache[key] = model
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
@@ -0,0 +1,206 @@
+"""
+Module with the profiler of the pipeline steps.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Union
+
+import pandas as pd
+from pandas import DataFrame
+
+from jutils import memory
+
+_activo = contextvars.ContextVar('perfilador', default=None)
+
+_COLUMNAS = ['nombre', 'clase', 'estado', 'acierto', 'inicio', 'duracion', 'cpu', 'memoria_pico',
+             'bytes_entradas', 'bytes_respuesta', 'proceso', 'hilo']
+
+
+def perfilador_activo() -> Union[None, 'Perfilador']:
+    return _activo.get()
+
+
+# Mediciones de memoria en curso en el proceso y cantidad de mediciones iniciadas, tracemalloc tiene un solo pico por
+# proceso y una medición que se solapa con otra no puede separar su pico.
+_memoria_lock = threading.Lock()
+_memoria_activas = 0
+_memoria_iniciadas = 0
+
+
+def medir(funcion, memoria: bool = False):
+    """
+    Ejecuta funcion y mide su tiempo de pared, tiempo de CPU del hilo y, si memoria es True, el pico de memoria
+    reservada con tracemalloc. El pico es None si otra medición del mismo proceso se ejecutó al mismo tiempo (pasos
+    en un pool de hilos), porque tracemalloc no separa la memoria de cada hilo. Si tracemalloc no estaba activo se
+    detiene al terminar.
+
+    Returns:
+        La respuesta de funcion y un diccionario con las métricas.
+    """
+    global _memoria_activas, _memoria_iniciadas
+    iniciado = False
+    if memoria:
+        with _memoria_lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                iniciado = True
+            solapada = _memoria_activas > 0
+            _memoria_activas += 1
+            _memoria_iniciadas += 1
+            numero = _memoria_iniciadas
+            if not solapada:
+                tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+    inicio = time.time()
+    contador, cpu = time.perf_counter(), time.thread_time()
+    try:
+        respuesta = funcion()
+    finally:
+        duracion, cpu = time.perf_counter() - contador, time.thread_time() - cpu
+        pico = None
+        if memoria:
+            with _memoria_lock:
+                _memoria_activas -= 1
+                if not solapada and _memoria_iniciadas == numero:
+                    pico = tracemalloc.get_traced_memory()[1] - base
+                if iniciado and not _memoria_activas:
+                    tracemalloc.stop()
+    metricas = {
+        'inicio': inicio,
+        'duracion': duracion,
+        'cpu': cpu,
+        'memoria_pico': pico,
+        'proceso': os.getpid(),
+        'hilo': threading.get_ident()
+    }
+    return respuesta, metricas
+
+
+class Perfilador:
+    """
+    Registra cada ejecución de los pasos mientras está activo, se activa como context manager o pasándolo a un
+    Proceso:
+
+        with Perfilador() as perfilador:
+            paso.run(a=5)
+        perfilador.exportar_chrome_trace('traza.json')
+    """
+
+    def __init__(self, memoria: bool = False):
+        """
+        Args:
+            memoria (): Si es True mide el pico de memoria de cada paso con tracemalloc, que hace más lenta la
+                ejecución y se detiene al salir del perfilador. Con los pasos en un pool de hilos el pico de los
+                que se solapan queda en None, ver medir.
+        """
+        self.memoria = memoria
+        self.registros = []
+        self._inicio = time.time()
+        self._lock = threading.Lock()
+        self._tokens = []
+
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        del estado['_lock'], estado['_tokens']
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._lock = threading.Lock()
+        self._tokens = []
+
+    def __enter__(self):
+        # tracemalloc queda activo mientras el perfilador que lo inició lo esté.
+        iniciado = self.memoria and not tracemalloc.is_tracing()
+        if iniciado:
+            tracemalloc.start()
+        self._tokens.append((_activo.set(self), iniciado))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        token, iniciado = self._tokens.pop()
+        _activo.reset(token)
+        if iniciado:
+            tracemalloc.stop()
+
+    def registrar(self, paso, estado: str, metricas: dict = None, entradas: dict = None, respuesta=None):
+        """
+        Agrega el registro de una ejecución o de un acierto de cache.
+
+        Args:
+            paso (): Paso registrado.
+            estado (): 'ejecutado', 'memoria' si la respuesta ya estaba en memoria o 'cache' si se cargó de disco.
+            metricas (): Métricas retornadas por medir, solo para los pasos ejecutados.
+            entradas (): kwargs recibidos por _run.
+            respuesta (): Respuesta de _run.
+        """
+        metricas = metricas or {'inicio': time.time(), 'duracion': 0.0, 'cpu': 0.0, 'memoria_pico': None,
+                                'proceso': os.getpid(), 'hilo': threading.get_ident()}
+        registro = {
+            'nombre': paso.nombre,
+            'clase': type(paso).__qualname__,
+            'estado': estado,
+            'acierto': estado != 'ejecutado',
+            **metricas,
+            'bytes_entradas': memory.sizeof(entradas, deep=False) if entradas is not None else None,
+            'bytes_respuesta': memory.sizeof(respuesta, deep=False) if respuesta is not None else None
+        }
+        with self._lock:
+            self.registros.append(registro)
+
+    def reporte(self) -> DataFrame:
+        """
+        Un registro por cada vez que se pidió un paso, con el tiempo de pared y de CPU, el pico de memoria,
+        si hubo acierto de cache y el tamaño de sus entradas y respuesta en bytes.
+        """
+        with self._lock:
+            registros = list(self.registros)
+        return pd.DataFrame(registros, columns=_COLUMNAS)
+
+    def resumen(self) -> DataFrame:
+        """
+        Totales por paso ordenados por el tiempo de pared.
+        """
+        reporte = self.reporte()
+        resumen = reporte.groupby('nombre').agg(
+            ejecuciones=('estado', lambda estado: int((estado == 'ejecutado').sum())),
+            aciertos=('acierto', 'sum'),
+            duracion=('duracion', 'sum'),
+            cpu=('cpu', 'sum'),
+            memoria_pico=('memoria_pico', 'max'),
+            bytes_respuesta=('bytes_respuesta', 'max')
+        )
+        return resumen.sort_values('duracion', ascending=False)
+
+    def chrome_trace(self) -> dict:
+        """
+        Registros en el formato de eventos de Chrome (chrome://tracing, Perfetto), las ejecuciones son eventos
+        completos y los aciertos de cache eventos instantáneos.
+        """
+        eventos = []
+        for registro in self.reporte().to_dict('records'):
+            evento = {
+                'name': registro['nombre'],
+                'cat': registro['estado'],
+                'ts': (registro['inicio'] - self._inicio) * 1e6,
+                'pid': registro['proceso'],
+                'tid': registro['hilo'],
+                'args': {columna: registro[columna] for columna in
+                         ['clase', 'cpu', 'memoria_pico', 'bytes_entradas', 'bytes_respuesta']
+                         if pd.notna(registro[columna])}
+            }
+            if registro['estado'] == 'ejecutado':
+                evento.update(ph='X', dur=registro['duracion'] * 1e6)
+            else:
+                evento.update(ph='i', s='t')
+            eventos.append(evento)
+        return {'traceEvents': eventos, 'displayTimeUnit': 'ms'}
+
+    def exportar_chrome_trace(self, path: Path):
+        with open(path, 'w') as archivo:
+            json.dump(self.chrome_trace(), archivo, default=float)
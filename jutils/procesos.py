@@ -1,49 +1,1070 @@
+import asyncio
+import contextlib
+import contextvars
+import copy
+import functools
+import inspect
+import os
 import pathlib
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import warnings
+import weakref
 
 import joblib
 from pathlib import Path
 from abc import ABC, abstractmethod
-from typing import List
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from typing import List, Union
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Series
+
+from jutils import memory
+from jutils.cache import CacheStore, FileLock, atomic_dump
+from jutils.perfilador import Perfilador, medir, perfilador_activo
+
+_limite_activo = contextvars.ContextVar('limite_memoria', default=None)
+
+# Segundos entre intentos de tomar el bloqueo de un paso que ejecuta otro proceso.
+_ESPERA_BLOQUEO = 0.05
+
+
+class _Claves:
+    """
+    Claves de los pasos en una ejecución, kwargs se hashea una sola vez y solo si algún paso lo necesita, y la clave
+    de cada paso se calcula una vez aunque la pidan varios pasos que dependen de él.
+    """
+
+    def __init__(self, kwargs: dict):
+        self.kwargs = kwargs
+        self._entradas = None
+        self._pasos = {}
+
+    @property
+    def entradas(self) -> str:
+        if self._entradas is None:
+            self._entradas = joblib.hash(self.kwargs)
+        return self._entradas
+
+    def de(self, paso) -> str:
+        if id(paso) not in self._pasos:
+            self._pasos[id(paso)] = paso._clave_con(self)
+        return self._pasos[id(paso)]
+
+
+@functools.lru_cache(maxsize=None)
+def _codigo(funcion) -> str:
+    try:
+        return inspect.getsource(funcion)
+    except (OSError, TypeError):
+        codigo = funcion.__code__
+        return repr((codigo.co_code, codigo.co_consts, codigo.co_names))
 
 
 class Paso(ABC):
-    def __init__(self, nombre, paso_anterior=None):
+    def __init__(self, nombre, paso_anterior=None, cache: Union[None, CacheStore, Path] = None):
+        """
+        Args:
+            nombre (): Nombre del paso.
+            paso_anterior (): Paso o lista de pasos de los que depende, sus respuestas se combinan en los kwargs
+                de _run en el orden de la lista.
+            cache (): CacheStore o carpeta donde se guarda la respuesta del paso bajo su clave, ver clave.
+        """
         self._nombre = nombre
-        self._paso_anterior = paso_anterior
+        if paso_anterior is None:
+            self._pasos_anteriores: List[Paso] = []
+        elif isinstance(paso_anterior, Paso):
+            self._pasos_anteriores = [paso_anterior]
+        else:
+            self._pasos_anteriores = list(paso_anterior)
+        self._cache = CacheStore(cache) if isinstance(cache, (str, Path)) else cache
         self._respuesta = None
+        self._ruta_respuesta = None
         self._executed = False
+        self._clave = None
+        self._tarea = None
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        estado['_tarea'] = None
+        del estado['_lock']
+        if estado['_ruta_respuesta'] is not None:
+            # La respuesta ya está en disco, se carga cuando se necesite.
+            estado['_respuesta'] = None
+        return estado
+
+    def __setstate__(self, estado):
+        if '_paso_anterior' in estado:
+            # Caches guardadas antes de que un paso pudiera tener varios anteriores.
+            anterior = estado.pop('_paso_anterior')
+            estado['_pasos_anteriores'] = [] if anterior is None else [anterior]
+        estado.setdefault('_cache', None)
+        estado.setdefault('_clave', None)
+        estado.setdefault('_ruta_respuesta', None)
+        estado.setdefault('_tarea', None)
+        self.__dict__.update(estado)
+        self._lock = threading.RLock()
+
+    @property
+    def respuesta(self):
+        """
+        Respuesta de la última ejecución, si está en disco se carga con sus arreglos de numpy mapeados en memoria
+        (copy on write).
+        """
+        if self._respuesta is None and self._ruta_respuesta is not None:
+            with warnings.catch_warnings():
+                # Los archivos comprimidos no se pueden mapear y joblib los lee completos.
+                warnings.filterwarnings('ignore', message='mmap_mode', category=UserWarning)
+                self._respuesta = joblib.load(self._ruta_respuesta, mmap_mode='c')
+        return self._respuesta
+
+    @property
+    def nombre(self):
+        return self._nombre
+
+    @property
+    def pasos_anteriores(self) -> list:
+        return list(self._pasos_anteriores)
 
     @abstractmethod
     def _run(self, **kwargs) -> dict:
         print(f'Ejecutando {self._nombre}')
         return {}
 
-    def run(self, force_execution=False, **kwargs):
-        if self._executed and not force_execution:
-            return self._respuesta
-        elif self._paso_anterior is not None:
-            self._respuesta = self._run(**self._paso_anterior.run(**kwargs))
-        else:
-            self._respuesta = self._run(**kwargs)
+    def _parametros(self) -> dict:
+        """
+        Parámetros que hacen parte de la clave del paso, por defecto sus atributos públicos.
+        """
+        return {nombre: valor for nombre, valor in vars(self).items() if not nombre.startswith('_')}
+
+    def clave(self, **kwargs) -> str:
+        """
+        Hash del nombre, el código de _run, los parámetros y las claves de los pasos anteriores, o de kwargs si no
+        tiene pasos anteriores. Cambiar un paso cambia su clave y la de todos los que dependen de él.
+        """
+        return _Claves(kwargs).de(self)
+
+    def _clave_con(self, claves: _Claves) -> str:
+        return joblib.hash({
+            'clase': f'{type(self).__module__}.{type(self).__qualname__}',
+            'nombre': self._nombre,
+            'codigo': _codigo(type(self)._run),
+            'parametros': self._parametros(),
+            'anteriores': [claves.de(paso) for paso in self._pasos_anteriores],
+            'entradas': None if self._pasos_anteriores else claves.entradas
+        })
+
+    def _vigente(self, claves: _Claves) -> Union[None, str]:
+        """
+        'memoria' si la respuesta del paso corresponde a las entradas de claves, 'cache' si se encontró en la cache o
+        None si hay que ejecutarlo.
+        """
+        if self._executed and self._respuesta is None and self._ruta_respuesta is not None \
+                and not Path(self._ruta_respuesta).exists():
+            self._executed = False
+        if self._cache is None:
+            return 'memoria' if self._executed else None
+        clave = claves.de(self)
+        if self._executed and self._clave == clave:
+            return 'memoria'
+        if self._cache.lookup(clave):
+            self._respuesta = None
+            self._ruta_respuesta = self._cache.path_for(clave)
+            self._executed = True
+            self._clave = clave
+            return 'cache'
+        return None
+
+    def _vigente_registrado(self, perfilador: Union[None, Perfilador], claves: _Claves) -> Union[None, str]:
+        estado = self._vigente(claves)
+        if estado and perfilador is not None:
+            perfilador.registrar(self, estado)
+        return estado
+
+    def _ejecutar_registrado(self, perfilador: Union[None, Perfilador], entradas: dict) -> dict:
+        if perfilador is None:
+            return _ejecutar(self, entradas)
+        respuesta, metricas = _ejecutar_medido(self, entradas, perfilador.memoria)
+        perfilador.registrar(self, 'ejecutado', metricas, entradas, respuesta)
+        return respuesta
+
+    def _aplicar(self, entradas: dict) -> dict:
+        """
+        Ejecuta _run con las entradas del paso.
+        """
+        return self._run(**entradas)
+
+    def _entradas(self, respuestas: list, **kwargs) -> dict:
+        """
+        Combina las respuestas de los pasos anteriores, los pasos sin anteriores reciben kwargs.
+        """
+        if not self._pasos_anteriores:
+            return kwargs
+        entradas = {}
+        for respuesta in respuestas:
+            entradas.update(respuesta)
+        return entradas
+
+    def _copia_liviana(self):
+        """
+        Copia del paso sin sus pasos anteriores ni su respuesta, para enviarla a otro proceso.
+        """
+        copia = copy.copy(self)
+        copia._pasos_anteriores = []
+        copia._respuesta = None
+        copia._ruta_respuesta = None
+        copia._tarea = None
+        return copia
+
+    def _guardar_respuesta(self, respuesta: dict, claves: _Claves):
+        self._ruta_respuesta = None
+        if self._cache is not None:
+            self._clave = claves.de(self)
+            self._cache.save(self._clave, respuesta)
+            self._ruta_respuesta = self._cache.path_for(self._clave)
+        self._respuesta = respuesta
         self._executed = True
-        return self._respuesta
+        if self._ruta_respuesta is not None:
+            self._guardada()
+
+    def _guardada(self):
+        """
+        Se llama cuando la respuesta del paso queda guardada en disco.
+        """
+
+    def run(self, force_execution=False, planificador=None, **kwargs):
+        """
+        Ejecuta el paso y los pasos anteriores que no estén vigentes. Los hilos que piden un paso mientras se ejecuta
+        esperan a que termine y reciben su respuesta, con una cache compartida también los otros procesos.
+        """
+        if planificador is not None:
+            return planificador.run(self, force_execution=force_execution, **kwargs)
+        return self._run_con(force_execution, _Claves(kwargs))
+
+    def _run_con(self, force_execution: bool, claves: _Claves):
+        perfilador = perfilador_activo()
+        with self._lock:
+            if not force_execution and self._vigente_registrado(perfilador, claves):
+                return _usado(self, self.respuesta)
+            with self._bloqueo(claves):
+                # Otro proceso pudo ejecutarlo mientras se esperaba el bloqueo.
+                if not force_execution and self._compartido() and self._vigente_registrado(perfilador, claves):
+                    return _usado(self, self.respuesta)
+                respuestas = [paso._run_con(False, claves) for paso in self._pasos_anteriores]
+                respuesta = self._ejecutar_registrado(perfilador, self._entradas(respuestas, **claves.kwargs))
+                self._guardar_respuesta(respuesta, claves)
+                return _usado(self, self.respuesta)
+
+    def _compartido(self) -> bool:
+        return self._cache is not None and self._cache.shared
+
+    def _bloqueo(self, claves: _Claves):
+        """
+        Bloqueo entre procesos de la clave del paso si su cache es compartida.
+        """
+        return self._cache.lock(claves.de(self)) if self._compartido() else contextlib.nullcontext()
+
+    async def run_async(self, force_execution=False, **kwargs):
+        """
+        Versión asíncrona de run, los pasos anteriores se esperan al mismo tiempo. Un _run definido con async def se
+        espera en el event loop, un _run síncrono se ejecuta en el executor por defecto del loop. Las llamadas
+        concurrentes a un paso en ejecución esperan la misma tarea, con una cache compartida los otros procesos
+        esperan el bloqueo de su clave.
+        """
+        return await self._run_async_con(force_execution, _Claves(kwargs))
+
+    async def _run_async_con(self, force_execution: bool, claves: _Claves):
+        if self._tarea is not None and not self._tarea.done():
+            return await asyncio.shield(self._tarea)
+        if not force_execution and self._vigente_registrado(perfilador_activo(), claves):
+            return _usado(self, self.respuesta)
+        self._tarea = asyncio.ensure_future(self._ejecutar_bloqueado(force_execution, claves))
+        return await asyncio.shield(self._tarea)
+
+    async def _ejecutar_bloqueado(self, force_execution: bool, claves: _Claves):
+        if not self._compartido():
+            return await self._ejecutar_async(claves)
+        loop = asyncio.get_running_loop()
+        bloqueo = self._bloqueo(claves)
+        await loop.run_in_executor(None, bloqueo.acquire)
+        try:
+            # Otro proceso pudo ejecutarlo mientras se esperaba el bloqueo.
+            if not force_execution and self._vigente_registrado(perfilador_activo(), claves):
+                return _usado(self, self.respuesta)
+            return await self._ejecutar_async(claves)
+        finally:
+            bloqueo.release()
+
+    async def _ejecutar_async(self, claves: _Claves):
+        respuestas = await asyncio.gather(*(paso._run_async_con(False, claves) for paso in self._pasos_anteriores))
+        entradas = self._entradas(list(respuestas), **claves.kwargs)
+        loop = asyncio.get_running_loop()
+        perfilador = perfilador_activo()
+        # Los pasos que redefinen _aplicar (particionados, incrementales) se ejecutan con él en el executor.
+        if inspect.iscoroutinefunction(self._run) and type(self)._aplicar is Paso._aplicar:
+            inicio, contador = time.time(), time.perf_counter()
+            respuesta = await self._run(**entradas)
+            if perfilador is not None:
+                # El tiempo de CPU de una corrutina se mezcla con el de las demás tareas del loop.
+                metricas = {'inicio': inicio, 'duracion': time.perf_counter() - contador, 'cpu': None,
+                            'memoria_pico': None, 'proceso': os.getpid(), 'hilo': threading.get_ident()}
+                perfilador.registrar(self, 'ejecutado', metricas, entradas, respuesta)
+        else:
+            # Los hilos del executor no heredan el perfilador activo.
+            respuesta = await loop.run_in_executor(
+                None, functools.partial(self._ejecutar_registrado, perfilador, entradas))
+        await loop.run_in_executor(None, functools.partial(self._guardar_respuesta, respuesta, claves))
+        return _usado(self, self.respuesta)
+
+
+def grafo(paso: Paso) -> List[Paso]:
+    """
+    Pasos de los que depende paso, incluido él, en orden topológico.
+    """
+    orden, visitados = [], set()
+
+    def visitar(actual, camino):
+        if id(actual) in camino:
+            raise ValueError(f'El paso {actual.nombre} depende de sí mismo')
+        if id(actual) in visitados:
+            return
+        for anterior in actual.pasos_anteriores:
+            visitar(anterior, camino | {id(actual)})
+        visitados.add(id(actual))
+        orden.append(actual)
+
+    visitar(paso, frozenset())
+    return orden
+
+
+def _usado(paso: Paso, respuesta: dict) -> dict:
+    limite = _limite_activo.get()
+    if limite is not None:
+        limite.usado(paso)
+    return respuesta
+
+
+def _ejecutar(paso: Paso, entradas: dict) -> dict:
+    respuesta = paso._aplicar(entradas)
+    if inspect.isawaitable(respuesta):
+        # Pasos con async def _run ejecutados de forma síncrona.
+        respuesta = asyncio.run(_esperar(respuesta))
+    return respuesta
+
+
+async def _esperar(awaitable):
+    return await awaitable
+
+
+def _ejecutar_medido(paso: Paso, entradas: dict, memoria: bool = False):
+    return medir(functools.partial(_ejecutar, paso, entradas), memoria)
+
+
+def _ejecutar_particion(paso: Paso, entradas: dict) -> dict:
+    respuesta = paso._run(**entradas)
+    if inspect.isawaitable(respuesta):
+        respuesta = asyncio.run(_esperar(respuesta))
+    return respuesta
+
+
+def combinar(respuestas: List[dict]) -> dict:
+    """
+    Combina en orden las respuestas parciales de un paso: concatena los DataFrames, Series, arreglos y listas de cada
+    llave, une los diccionarios, suma los números y deja los demás valores en una lista.
+    """
+    combinada = {}
+    for llave in respuestas[0] if respuestas else []:
+        valores = [respuesta[llave] for respuesta in respuestas]
+        if isinstance(valores[0], (DataFrame, Series)):
+            combinada[llave] = pd.concat(valores)
+        elif isinstance(valores[0], np.ndarray):
+            combinada[llave] = np.concatenate(valores)
+        elif isinstance(valores[0], list):
+            combinada[llave] = [item for valor in valores for item in valor]
+        elif isinstance(valores[0], dict):
+            combinada[llave] = {clave: item for valor in valores for clave, item in valor.items()}
+        elif all(isinstance(valor, (int, float, np.number)) for valor in valores):
+            combinada[llave] = sum(valores)
+        else:
+            combinada[llave] = valores
+    return combinada
+
+
+class PasoParticionado(Paso):
+    """
+    Paso cuyo _run se aplica por separado a particiones de una de sus entradas, un DataFrame, Series o arreglo de
+    numpy, en un pool de procesos. Las respuestas de las particiones se combinan con _combinar y, si el paso tiene
+    cache, cada una se guarda bajo el hash de su contenido, así al cambiar o fallar una partición solo se ejecuta esa.
+    Al particionar por llave las respuestas con una fila por cada fila de la partición vuelven al orden de la entrada.
+
+        class Normalizar(PasoParticionado):
+            def _run(self, datos) -> dict:
+                return {'datos': datos / datos.sum()}
+
+        Normalizar('normalizar', paso_anterior, columna='datos', por='cliente')
+    """
+
+    def __init__(self, nombre, paso_anterior=None, cache: Union[None, CacheStore, Path] = None, columna: str = None,
+                 filas: int = 100_000, por: Union[None, str, list] = None, particiones: int = None,
+                 max_workers: int = None, procesos: bool = True):
+        """
+        Args:
+            nombre (): Nombre del paso.
+            paso_anterior (): Paso o lista de pasos de los que depende.
+            cache (): CacheStore o carpeta donde se guardan la respuesta del paso y las de sus particiones.
+            columna (): Entrada que se particiona, por defecto la primera que sea un DataFrame, Series o arreglo. Las
+                demás entradas se pasan completas a cada partición.
+            filas (): Filas de cada partición cuando por es None.
+            por (): Columna o columnas de la llave, las filas con la misma llave quedan en la misma partición.
+            particiones (): Cantidad de particiones cuando se particiona por llave, por defecto la cantidad de CPUs.
+            max_workers (): Cantidad máxima de particiones ejecutándose al mismo tiempo.
+            procesos (): Si es False usa un pool de hilos, útil si _run libera el GIL.
+        """
+        super().__init__(nombre, paso_anterior, cache)
+        self.columna = columna
+        self.filas = filas
+        self.por = por
+        self.particiones = particiones
+        self._max_workers = max_workers
+        self._procesos = procesos
+
+    @abstractmethod
+    def _run(self, **kwargs) -> dict:
+        """
+        Procesa una partición, recibe las entradas del paso con la columna particionada reemplazada por la partición.
+        """
+        return {}
+
+    def _combinar(self, respuestas: List[dict]) -> dict:
+        """
+        Combina las respuestas de las particiones en su orden, por defecto con combinar.
+        """
+        return combinar(respuestas)
+
+    def _parametros(self) -> dict:
+        return {**super()._parametros(), '_combinar': _codigo(type(self)._combinar)}
+
+    def _columna(self, entradas: dict) -> str:
+        if self.columna is not None:
+            return self.columna
+        for nombre, valor in entradas.items():
+            if isinstance(valor, (DataFrame, Series, np.ndarray)):
+                return nombre
+        raise ValueError(f'El paso {self.nombre} no recibió un DataFrame, Series o arreglo para particionar')
+
+    def _particionar(self, datos) -> tuple:
+        """
+        Particiones de datos y, si se particiona por llave, las posiciones de sus filas en datos.
+        """
+        if self.por is None:
+            filas = datos.iloc if isinstance(datos, (DataFrame, Series)) else datos
+            return [filas[inicio:inicio + self.filas] for inicio in range(0, len(datos), self.filas)] or [datos], None
+        if not isinstance(datos, DataFrame):
+            raise ValueError(f'El paso {self.nombre} solo puede particionar por llave un DataFrame')
+        particiones = self.particiones or os.cpu_count() or 1
+        grupo = pd.util.hash_pandas_object(datos[self.por], index=False).to_numpy() % particiones
+        posiciones = [np.flatnonzero(grupo == numero) for numero in range(particiones)]
+        posiciones = [filas for filas in posiciones if len(filas)]
+        if not posiciones:
+            return [datos], None
+        return [datos.iloc[filas] for filas in posiciones], posiciones
+
+    @staticmethod
+    def _restaurar_orden(combinada: dict, respuestas: List[dict], posiciones: list) -> dict:
+        """
+        Devuelve al orden de las filas de la entrada los DataFrames, Series y arreglos combinados que tienen una fila
+        por cada fila de su partición, los demás quedan en el orden de las particiones.
+        """
+        orden = np.argsort(np.concatenate(posiciones), kind='stable')
+        for llave, valor in combinada.items():
+            if not isinstance(valor, (DataFrame, Series, np.ndarray)) or len(valor) != len(orden):
+                continue
+            if not all(isinstance(respuesta.get(llave), (DataFrame, Series, np.ndarray))
+                       and len(respuesta[llave]) == len(filas) for respuesta, filas in zip(respuestas, posiciones)):
+                continue
+            combinada[llave] = valor[orden] if isinstance(valor, np.ndarray) else valor.iloc[orden]
+        return combinada
+
+    def _clave_particion(self, particion, otras: dict) -> str:
+        return joblib.hash({
+            'clase': f'{type(self).__module__}.{type(self).__qualname__}',
+            'codigo': _codigo(type(self)._run),
+            'parametros': super()._parametros(),
+            'particion': particion,
+            'entradas': otras
+        })
+
+    def _aplicar(self, entradas: dict) -> dict:
+        columna = self._columna(entradas)
+        otras = {nombre: valor for nombre, valor in entradas.items() if nombre != columna}
+        particiones, posiciones = self._particionar(entradas[columna])
+        claves = [self._clave_particion(particion, otras) if self._cache is not None else None
+                  for particion in particiones]
+        respuestas = [self._cache.load(clave) if clave is not None and self._cache.lookup(clave) else None
+                      for clave in claves]
+        pendientes = [numero for numero, respuesta in enumerate(respuestas) if respuesta is None]
+        if pendientes:
+            pool = ProcessPoolExecutor if self._procesos else ThreadPoolExecutor
+            enviado = self._copia_liviana()
+            errores = []
+            with pool(max_workers=min(len(pendientes), self._max_workers or os.cpu_count() or 1)) as executor:
+                futures = {executor.submit(_ejecutar_particion, enviado, {**otras, columna: particiones[numero]}):
+                           numero for numero in pendientes}
+                for future in as_completed(futures):
+                    numero = futures[future]
+                    try:
+                        respuestas[numero] = future.result()
+                    except Exception as error:
+                        # Las demás particiones terminan y se guardan antes de propagar el error.
+                        errores.append(error)
+                        continue
+                    if claves[numero] is not None:
+                        self._cache.save(claves[numero], respuestas[numero])
+            if errores:
+                raise errores[0]
+        combinada = self._combinar(respuestas)
+        if posiciones is not None:
+            combinada = self._restaurar_orden(combinada, respuestas, posiciones)
+        return combinada
+
+
+class PasoIncremental(Paso):
+    """
+    Paso cuyo _run es un generador que entrega su respuesta por partes. Cada parte se guarda en disco apenas se
+    entrega, si la ejecución se interrumpe la siguiente continúa desde la última parte guardada, con avance igual a
+    la cantidad de partes que ya tiene. Al terminar las partes se combinan con _combinar.
+
+        class Ajustar(PasoIncremental):
+            def _run(self, datos) -> dict:
+                for entidad in datos['entidad'].unique()[self.avance:]:
+                    yield {'modelos': {entidad: ajustar(datos[datos['entidad'] == entidad])}}
+
+    Las partes se guardan bajo el hash de las entradas en <cache>/avances si el paso tiene cache o en
+    <cache_path>_pasos/avances si se ejecuta desde un Proceso en cache, sin ninguna de las dos no se guardan. Se
+    borran cuando la respuesta completa queda guardada.
+    """
+
+    def __init__(self, nombre, paso_anterior=None, cache: Union[None, CacheStore, Path] = None):
+        super().__init__(nombre, paso_anterior, cache)
+        self._avance = 0
+        self._avances = None
+        self._carpeta_avances = None
+
+    @property
+    def avance(self) -> int:
+        """
+        Partes guardadas antes de la ejecución actual, _run debe continuar desde la siguiente.
+        """
+        return self._avance
+
+    @abstractmethod
+    def _run(self, **kwargs):
+        yield {}
+
+    def _combinar(self, partes: List[dict]) -> dict:
+        """
+        Combina las partes en su orden, por defecto con combinar.
+        """
+        return combinar(partes)
+
+    def _parametros(self) -> dict:
+        return {**super()._parametros(), '_combinar': _codigo(type(self)._combinar)}
+
+    def _entradas(self, respuestas: list, **kwargs) -> dict:
+        entradas = super()._entradas(respuestas, **kwargs)
+        base = self._cache.path.joinpath('avances') if self._cache is not None else self._carpeta_avances
+        self._avances = None
+        if base is not None:
+            # Las respuestas cargadas de disco son memmaps, se comparan por su contenido.
+            self._avances = Path(base).joinpath(joblib.hash({
+                'clase': f'{type(self).__module__}.{type(self).__qualname__}',
+                'nombre': self._nombre,
+                'codigo': _codigo(type(self)._run),
+                'parametros': self._parametros(),
+                'entradas': entradas
+            }, coerce_mmap=True))
+        return entradas
+
+    def _aplicar(self, entradas: dict) -> dict:
+        if self._avances is None:
+            self._avance = 0
+            return self._combinar(list(self._run(**entradas)))
+        self._avances.mkdir(exist_ok=True, parents=True)
+        self._avance = len(list(self._avances.glob('*.joblib')))
+        for numero, parte in enumerate(self._run(**entradas), start=self._avance):
+            atomic_dump(parte, self._avances.joinpath(f'{numero:06d}.joblib'))
+        return self._combinar([joblib.load(ruta) for ruta in sorted(self._avances.glob('*.joblib'))])
+
+    def _guardada(self):
+        if self._avances is not None:
+            shutil.rmtree(self._avances, ignore_errors=True)
+        self._avances = None
+        self._avance = 0
+
+
+class Planificador:
+    """
+    Ejecuta los pasos de un grafo en un pool de hilos o de procesos, cada paso inicia apenas terminan los pasos de los
+    que depende, así las ramas independientes se ejecutan al mismo tiempo.
+    """
+
+    def __init__(self, max_workers: int = None, procesos: bool = False):
+        """
+        Args:
+            max_workers (): Cantidad máxima de pasos ejecutándose al mismo tiempo.
+            procesos (): Si es True usa un pool de procesos, los pasos y sus respuestas deben poder serializarse.
+        """
+        self.max_workers = max_workers
+        self.procesos = procesos
+
+    def _executor(self):
+        if self.procesos:
+            return ProcessPoolExecutor(max_workers=self.max_workers)
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='paso')
+
+    @staticmethod
+    def _pendientes(paso: Paso, force_execution, claves: _Claves, perfilador=None) -> List[Paso]:
+        """
+        Pasos que hay que ejecutar en orden topológico, los anteriores de un paso vigente no se visitan.
+        """
+        grafo(paso)
+        pendientes, visitados = [], set()
+
+        def visitar(actual, forzar):
+            if id(actual) in visitados:
+                return
+            visitados.add(id(actual))
+            if not forzar and actual._vigente_registrado(perfilador, claves):
+                _usado(actual, None)
+                return
+            for anterior in actual.pasos_anteriores:
+                visitar(anterior, False)
+            pendientes.append(actual)
+
+        visitar(paso, force_execution)
+        return pendientes
+
+    def run(self, paso: Paso, force_execution=False, **kwargs) -> dict:
+        """
+        Ejecuta paso y los pasos pendientes de su grafo, las llamadas concurrentes con el mismo paso esperan a que
+        termine la primera.
+        """
+        with paso._lock:
+            return self._run(paso, force_execution, **kwargs)
+
+    def _run(self, paso: Paso, force_execution=False, **kwargs) -> dict:
+        perfilador = perfilador_activo()
+        claves = _Claves(kwargs)
+        pendientes = self._pendientes(paso, force_execution, claves, perfilador)
+        forzado = paso if force_execution else None
+        en_ejecucion, bloqueos = {}, {}
+        try:
+            with self._executor() as executor:
+                while pendientes or en_ejecucion:
+                    for actual in list(pendientes):
+                        anteriores = actual.pasos_anteriores
+                        ejecutandose = [ejecutado for ejecutado, _ in en_ejecucion.values()]
+                        if any(anterior in pendientes or anterior in ejecutandose for anterior in anteriores):
+                            continue
+                        if actual._compartido():
+                            # Si otro proceso ejecuta el paso se intenta de nuevo en la siguiente vuelta.
+                            bloqueo = actual._bloqueo(claves)
+                            if not bloqueo.acquire(blocking=False):
+                                continue
+                            bloqueos[id(actual)] = bloqueo
+                            if actual is not forzado and actual._vigente_registrado(perfilador, claves):
+                                bloqueos.pop(id(actual)).release()
+                                pendientes.remove(actual)
+                                _usado(actual, None)
+                                continue
+                        entradas = actual._entradas([anterior.respuesta for anterior in anteriores], **kwargs)
+                        enviado = actual._copia_liviana() if self.procesos else actual
+                        if perfilador is None:
+                            future = executor.submit(_ejecutar, enviado, entradas)
+                        else:
+                            future = executor.submit(_ejecutar_medido, enviado, entradas, perfilador.memoria)
+                        en_ejecucion[future] = (actual, entradas)
+                        pendientes.remove(actual)
+                    if not en_ejecucion:
+                        if pendientes:
+                            time.sleep(_ESPERA_BLOQUEO)
+                        continue
+                    espera = _ESPERA_BLOQUEO if pendientes else None
+                    terminados, _ = wait(en_ejecucion, timeout=espera, return_when=FIRST_COMPLETED)
+                    for future in terminados:
+                        actual, entradas = en_ejecucion.pop(future)
+                        try:
+                            respuesta = future.result()
+                        except BaseException:
+                            for otro in en_ejecucion:
+                                otro.cancel()
+                            raise
+                        if perfilador is not None:
+                            respuesta, metricas = respuesta
+                            perfilador.registrar(actual, 'ejecutado', metricas, entradas, respuesta)
+                        actual._guardar_respuesta(respuesta, claves)
+                        if id(actual) in bloqueos:
+                            bloqueos.pop(id(actual)).release()
+                        _usado(actual, None)
+        finally:
+            for bloqueo in bloqueos.values():
+                bloqueo.release()
+        return paso.respuesta
+
+
+class LimiteMemoria:
+    """
+    Mantiene el tamaño de las respuestas en memoria de los pasos por debajo de maximo. Cuando lo supera libera, de la
+    usada hace más tiempo a la más reciente, las respuestas que ya leyeron todos los pasos que dependen de ellas en la
+    ejecución actual. Las que no están en disco se guardan antes en carpeta y Paso.respuesta las carga de nuevo si se
+    vuelven a necesitar.
+    """
+
+    def __init__(self, maximo: int, carpeta: Path = None, compress: Union[int, bool, str, tuple] = 0):
+        """
+        Args:
+            maximo (): Bytes de las respuestas que se mantienen en memoria, medidos con memory.sizeof.
+            carpeta (): Carpeta donde se guardan las respuestas liberadas, si es None se usa una carpeta temporal
+                que se borra junto con el límite.
+            compress (): Compresión de joblib para las respuestas liberadas.
+        """
+        self.maximo = maximo
+        self.carpeta = carpeta
+        self.compress = compress
+        self.liberadas = 0
+        self._temporal = None
+        self._residentes = OrderedDict()
+        self._consumidores = {}
+        self._usados = set()
+        self._activas = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        del estado['_lock']
+        estado.update(_residentes=OrderedDict(), _consumidores={}, _usados=set(), _activas=0, _temporal=None)
+        if self._temporal is not None:
+            estado['carpeta'] = None
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def activar(self, paso: Paso):
+        """
+        Activa el límite mientras se ejecuta paso, al terminar todas las respuestas pueden liberarse. Con varias
+        ejecuciones activas al mismo tiempo los consumidores pendientes se suman y se reinician al terminar la última.
+        """
+        consumidores = {}
+        for actual in grafo(paso):
+            for anterior in {id(anterior) for anterior in actual.pasos_anteriores}:
+                consumidores[anterior] = consumidores.get(anterior, 0) + 1
+        consumidores[id(paso)] = consumidores.get(id(paso), 0) + 1
+        with self._lock:
+            if not self._activas:
+                self._usados = set()
+            self._activas += 1
+            for clave, cantidad in consumidores.items():
+                self._consumidores[clave] = self._consumidores.get(clave, 0) + cantidad
+        token = _limite_activo.set(self)
+        try:
+            yield self
+        finally:
+            _limite_activo.reset(token)
+            with self._lock:
+                self._activas -= 1
+                if not self._activas:
+                    self._consumidores, self._usados = {}, set()
+                self._ajustar()
+
+    def usado(self, paso: Paso):
+        """
+        Registra que la respuesta de paso está lista y que ya leyó las de sus pasos anteriores.
+        """
+        with self._lock:
+            if id(paso) not in self._usados:
+                self._usados.add(id(paso))
+                for anterior in {id(anterior): anterior for anterior in paso.pasos_anteriores}.values():
+                    self._consumidores[id(anterior)] = self._consumidores.get(id(anterior), 1) - 1
+                    self._residente(anterior)
+            self._residente(paso)
+            self._ajustar()
+
+    def residentes(self) -> int:
+        """
+        Bytes de las respuestas en memoria registradas.
+        """
+        with self._lock:
+            return sum(tamano for _, tamano in self._residentes.values())
+
+    def _residente(self, paso: Paso):
+        if paso._respuesta is not None:
+            self._residentes[id(paso)] = (paso, memory.sizeof(paso._respuesta))
+            self._residentes.move_to_end(id(paso))
+
+    def _ajustar(self):
+        for clave, (paso, _) in list(self._residentes.items()):
+            if paso._respuesta is None:
+                del self._residentes[clave]
+        total = sum(tamano for _, tamano in self._residentes.values())
+        for clave, (paso, tamano) in list(self._residentes.items()):
+            if total <= self.maximo:
+                break
+            # Los pasos que otro hilo está ejecutando se dejan en memoria.
+            if self._consumidores.get(clave, 0) > 0 or not paso._lock.acquire(blocking=False):
+                continue
+            try:
+                self._liberar(paso)
+            finally:
+                paso._lock.release()
+            del self._residentes[clave]
+            total -= tamano
+
+    def _liberar(self, paso: Paso):
+        if paso._ruta_respuesta is None or not Path(paso._ruta_respuesta).exists():
+            if self.carpeta is None:
+                self.carpeta = Path(tempfile.mkdtemp(prefix='jutils-'))
+                self._temporal = weakref.finalize(self, shutil.rmtree, self.carpeta, True)
+            carpeta = Path(self.carpeta)
+            carpeta.mkdir(exist_ok=True, parents=True)
+            ruta = carpeta.joinpath(f'{paso.nombre}-{uuid.uuid4().hex[:8]}.joblib').absolute()
+            atomic_dump(paso._respuesta, ruta, self.compress)
+            paso._ruta_respuesta = ruta
+        paso._respuesta = None
+        self.liberadas += 1
 
 
 class Proceso:
-    def __init__(self, cached=False, cache_path=None):
+    def __init__(self, cached=False, cache_path=None, planificador: Planificador = None,
+                 compress: Union[int, bool, str, tuple] = 0, perfilador: Perfilador = None,
+                 memoria_maxima: int = None, compartido: bool = False, lease: float = 60.0):
+        """
+        Args:
+            cached (): Si es True save_cache guarda el proceso en cache_path.
+            cache_path (): Archivo del proceso, las respuestas de los pasos se guardan en la carpeta
+                <cache_path>_pasos junto a él.
+            planificador (): Planificador usado por run.
+            compress (): Compresión de joblib para las respuestas, sin compresión sus arreglos de numpy se mapean en
+                memoria al cargarlas.
+            perfilador (): Perfilador activo durante run y run_async.
+            memoria_maxima (): Bytes de respuestas de los pasos que se mantienen en memoria durante run y run_async,
+                ver LimiteMemoria. Las respuestas liberadas se guardan en <cache_path>_pasos si el proceso está en
+                cache o en una carpeta temporal.
+            compartido (): Si es True varios procesos o nodos usan la misma cache, cada run carga lo que guardaron
+                los demás y al terminar guarda la cache con el bloqueo <cache_path>.lock. Si todos los pasos usan un
+                CacheStore compartido el bloqueo solo se toma al cargar y al guardar, y los bloqueos de sus claves
+                coordinan los pasos, así los procesos ejecutan pasos distintos al mismo tiempo. Si no, cada run
+                toma el bloqueo durante toda la ejecución.
+            lease (): Segundos sin renovar tras los que el bloqueo de un proceso caído se considera abandonado, ver
+                FileLock.
+        """
         self._cached = cached
         self._cache_path = cache_path
+        self._planificador = planificador
+        self._compress = compress
+        self._perfilador = perfilador
+        self._limite = None
+        if memoria_maxima is not None:
+            carpeta = self._cache_dir if cached and cache_path is not None else None
+            self._limite = LimiteMemoria(memoria_maxima, carpeta, compress)
+        self._compartido = compartido
+        self._lease = lease
+        self._leido = None
+        # Pasos ejecutados con run o run_async aunque no estén en los atributos del proceso, save_cache conserva sus
+        # respuestas en disco mientras existan.
+        self._ejecutados = weakref.WeakValueDictionary()
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        estado.pop('_lock', None)
+        estado.pop('_ejecutados', None)
+        estado['_leido'] = None
+        return estado
+
+    def __setstate__(self, estado):
+        # Caches guardadas por versiones anteriores del proceso.
+        estado.setdefault('_planificador', None)
+        estado.setdefault('_compress', 0)
+        estado.setdefault('_perfilador', None)
+        estado.setdefault('_limite', None)
+        estado.setdefault('_compartido', False)
+        estado.setdefault('_lease', 60.0)
+        estado.setdefault('_leido', None)
+        self.__dict__.update(estado)
+        self._ejecutados = weakref.WeakValueDictionary()
+        self._lock = threading.RLock()
+
+    @property
+    def perfilador(self) -> Union[None, Perfilador]:
+        return self._perfilador
+
+    @property
+    def limite_memoria(self) -> Union[None, LimiteMemoria]:
+        return self._limite
+
+    def _contexto(self, paso: Paso):
+        for actual in grafo(paso):
+            self._ejecutados[id(actual)] = actual
+        if self._cached and self._cache_path is not None:
+            for actual in grafo(paso):
+                if isinstance(actual, PasoIncremental):
+                    actual._carpeta_avances = self._cache_dir.joinpath('avances')
+        contexto = contextlib.ExitStack()
+        if self._perfilador is not None:
+            contexto.enter_context(self._perfilador)
+        if self._limite is not None:
+            contexto.enter_context(self._limite.activar(paso))
+        return contexto
+
+    def run(self, paso: Paso, force_execution=False, **kwargs) -> dict:
+        """
+        Ejecuta paso, con el planificador del proceso si tiene uno, y guarda la cache aunque la ejecución falle.
+        """
+        por_paso = self._por_paso(paso)
+        with self._bloqueo(not por_paso):
+            self._sincronizar_con(por_paso)
+            try:
+                with self._contexto(paso):
+                    respuesta = paso.run(force_execution=force_execution, planificador=self._planificador, **kwargs)
+            finally:
+                # Si un paso falla se guardan los que sí terminaron.
+                self._guardar_con(por_paso)
+        return respuesta
+
+    def _por_paso(self, paso: Paso) -> bool:
+        """
+        True si todos los pasos del grafo de paso usan un CacheStore compartido, sus bloqueos coordinan los pasos.
+        """
+        return all(actual._compartido() for actual in grafo(paso))
+
+    def _sincronizar_con(self, tomar: bool):
+        with self._bloqueo(tomar):
+            self._sincronizar()
+
+    def _guardar_con(self, tomar: bool):
+        """
+        Guarda la cache conservando las respuestas que guardaron otros procesos durante la ejecución.
+        """
+        with self._bloqueo(tomar):
+            self._sincronizar(solo_pendientes=True)
+            self.save_cache()
+
+    def _bloqueo(self, tomar: bool = True) -> Union[FileLock, contextlib.nullcontext]:
+        if not (tomar and self._compartido and self._cached):
+            return contextlib.nullcontext()
+        return FileLock(self._cache_path.with_name(self._cache_path.name + '.lock'), self._lease)
+
+    def _sincronizar(self, solo_pendientes: bool = False):
+        """
+        Toma de la cache en disco las respuestas que guardaron otros procesos, si cambió desde la última lectura. Con
+        solo_pendientes solo las de los pasos que este proceso no ha ejecutado.
+        """
+        if not (self._compartido and self._cached) or not self._cache_path.exists():
+            return
+        modificado = self._cache_path.stat().st_mtime_ns
+        if modificado == self._leido:
+            return
+        guardado = joblib.load(self._cache_path)
+        for paso, otro in zip(self._pasos(), guardado._pasos()):
+            if paso.nombre != otro.nombre or not otro._executed or otro._ruta_respuesta is None \
+                    or solo_pendientes and paso._executed:
+                continue
+            with paso._lock:
+                paso._respuesta = None
+                paso._ruta_respuesta = otro._ruta_respuesta
+                paso._executed = True
+                paso._clave = otro._clave
+        self._leido = modificado
+
+    @property
+    def _cache_dir(self) -> Path:
+        return self._cache_path.with_name(self._cache_path.stem + '_pasos')
+
+    def _pasos(self) -> List[Paso]:
+        """
+        Pasos guardados en los atributos del proceso (directamente o en listas, tuplas y diccionarios), los
+        ejecutados con run o run_async que siguen existiendo y los pasos de los que dependen.
+        """
+        pasos = {}
+
+        def agregar(valor):
+            if isinstance(valor, Paso):
+                for paso in grafo(valor):
+                    pasos.setdefault(id(paso), paso)
+            elif isinstance(valor, (list, tuple)):
+                for item in valor:
+                    agregar(item)
+            elif isinstance(valor, dict):
+                for item in valor.values():
+                    agregar(item)
+
+        for atributo in vars(self).values():
+            agregar(atributo)
+        agregar(list(self._ejecutados.values()))
+        return list(pasos.values())
+
+    async def run_async(self, paso: Paso, force_execution=False, **kwargs) -> dict:
+        """
+        Versión asíncrona de run, el bloqueo y la cache se manejan en el executor por defecto del loop.
+        """
+        loop = asyncio.get_running_loop()
+        por_paso = self._por_paso(paso)
+        bloqueo = self._bloqueo(not por_paso)
+        await loop.run_in_executor(None, bloqueo.__enter__)
+        try:
+            await loop.run_in_executor(None, self._sincronizar_con, por_paso)
+            try:
+                with self._contexto(paso):
+                    respuesta = await paso.run_async(force_execution=force_execution, **kwargs)
+            finally:
+                await loop.run_in_executor(None, self._guardar_con, por_paso)
+        finally:
+            bloqueo.__exit__(None, None, None)
+        return respuesta
 
     def save_cache(self):
-        if self._cached:
+        """
+        Guarda en disco solo las respuestas nuevas o que cambiaron y luego el proceso sin ellas, por último borra
+        las respuestas que ya no usa ningún paso. Cada archivo se escribe con un nombre temporal y se renombra, así
+        un proceso que lee la cache nunca encuentra un archivo incompleto.
+        """
+        if not self._cached:
+            return
+        with self._lock:
             self._cache_path.parent.mkdir(exist_ok=True, parents=True)
-            joblib.dump(self, self._cache_path)
+            self._cache_dir.mkdir(exist_ok=True)
+            pasos = self._pasos()
+            for paso in pasos:
+                with paso._lock:
+                    if paso._executed and paso._ruta_respuesta is None:
+                        ruta = self._cache_dir.joinpath(f'{paso.nombre}-{uuid.uuid4().hex[:8]}.joblib').absolute()
+                        atomic_dump(paso._respuesta, ruta, self._compress)
+                        paso._ruta_respuesta = ruta
+                        paso._guardada()
+            atomic_dump(self, self._cache_path)
+            self._leido = self._cache_path.stat().st_mtime_ns
+            usadas = {Path(paso._ruta_respuesta) for paso in pasos if paso._ruta_respuesta is not None}
+            for archivo in self._cache_dir.glob('*.joblib'):
+                if archivo.absolute() not in usadas:
+                    archivo.unlink()
 
     def clean_cache(self):
         if self._cache_path is not None and self._cache_path.exists():
             print("Limpiando cache")
             self._cache_path.unlink()
             self._cached = False
+        if self._cache_path is not None and self._cache_dir.exists():
+            shutil.rmtree(self._cache_dir)
 
     @classmethod
     def from_cache(cls, def_process, cached=False, cache_path=None):
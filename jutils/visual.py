@@ -71,6 +71,7 @@ class Plot:
         return px.imshow(df_heatmap, color_continuous_scale=self.color_continuous_scale, title=f'{x} vs {y}', **kwargs)
 
     def box(self, df: DataFrame, y: str, x: str = None, title: str = None, nbins=5, notched=False,
+            aggregate: bool = None, aggregate_threshold: int = 100_000, max_outliers: int = 1000,
             **kwargs) -> go.Figure:
         """
         Display a boxplot, in reality the x axis is always categorical, but when numerical data is passed
@@ -83,13 +84,23 @@ class Plot:
             title (): Plot title.
             nbins: Cant of bins to plot when x is numerical.
             notched (): Set a notch in the plot.
-            **kwargs (): Aditional parameters to pass to plotly.express.imshow.
+            aggregate (): If True the quartiles, whiskers and outliers of each group are computed here and the
+                figure only contains them instead of every value. By default only when df has more than
+                aggregate_threshold rows and no kwargs are given.
+            aggregate_threshold (): Rows above which the data is aggregated when aggregate is None.
+            max_outliers (): Max outliers per group kept when the data is aggregated, evenly spaced by value and
+                including the most extreme ones.
+            **kwargs (): Aditional parameters to pass to plotly.express.box, or to go.Box when the data is
+                aggregated.
 
         Returns:
             A Figure that can be displayed with the method show().
 
         """
-        transformed_df = df.copy()
+        if aggregate is None:
+            aggregate = len(df) > aggregate_threshold and not kwargs
+        # Only the aggregated figure can drop the columns, kwargs of px.box (color, hover_data, ...) may use them.
+        transformed_df = df[[y] if x is None or x == y else [x, y]] if aggregate else df
         if x is not None and pd.api.types.is_numeric_dtype(transformed_df[x]):
             minimo = transformed_df[x].min()
             maximo = transformed_df[x].max()
@@ -97,13 +108,65 @@ class Plot:
             labels = [f'[{lim_min}-{lim_max})'
                       for lim_min, lim_max in zip(limites[0:nbins - 1], limites[1:nbins])]
             bins = pd.cut(transformed_df[x], bins=limites, labels=labels, include_lowest=True)
-            transformed_df[x] = bins
+            transformed_df = transformed_df.assign(**{x: bins})
         if title is None:
             title = f'Boxplot {x} vs {y}' if x is not None else f'Boxplot {y}'
+        if aggregate:
+            return self._aggregated_box(transformed_df, y, x, title, notched, max_outliers, **kwargs)
         return px.box(transformed_df, x=x, y=y, title=title, notched=notched,
                       color_discrete_sequence=self.color_discrete_sequence, **kwargs)
 
-    def histogram(self, df: DataFrame, x: str, nbins: int = None, text_auto=True, **kwargs) -> go.Figure:
+    @staticmethod
+    def _box_statistics(df: DataFrame, y: str, x: str = None, max_outliers: int = 1000):
+        """
+        Quartiles, whiskers (the furthest values within 1.5 IQR of the box) and count of y per group of x, and up to
+        max_outliers outliers per group.
+        """
+        df = df[df[y].notna()]
+        keys = df[x] if x is not None else pd.Series(y, index=df.index)
+        sort = isinstance(keys.dtype, pd.CategoricalDtype)
+        values = df[y]
+        grouped = values.groupby(keys, observed=True, sort=sort)
+        stats = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+        stats.columns = ['q1', 'median', 'q3']
+        stats['count'] = grouped.size()
+        iqr = stats['q3'] - stats['q1']
+        lower = (stats['q1'] - 1.5 * iqr).reindex(keys).to_numpy()
+        upper = (stats['q3'] + 1.5 * iqr).reindex(keys).to_numpy()
+        inside = ((values >= lower) & (values <= upper)).to_numpy()
+        whiskers = values[inside].groupby(keys[inside], observed=True, sort=sort)
+        stats['lowerfence'] = whiskers.min()
+        stats['upperfence'] = whiskers.max()
+        stats['notchspan'] = 1.57 * iqr / np.sqrt(stats['count'])
+        outliers = pd.DataFrame({'key': keys[~inside], 'value': values[~inside]}).sort_values('value', kind='stable')
+        by_key = outliers.groupby('key', observed=True, sort=False)
+        rank = by_key.cumcount()
+        size = by_key['value'].transform('size')
+        step = np.ceil(size / max_outliers)
+        outliers = outliers[(rank % step == 0) | (rank == size - 1)]
+        return stats, outliers
+
+    def _aggregated_box(self, df: DataFrame, y: str, x: str, title: str, notched: bool, max_outliers: int,
+                        **kwargs) -> go.Figure:
+        stats, outliers = self._box_statistics(df, y, x, max_outliers)
+        color = self.color_discrete_sequence[0]
+        positions = {} if x is None else {'x': list(stats.index)}
+        fig = go.Figure()
+        fig.add_trace(go.Box(
+            q1=stats['q1'], median=stats['median'], q3=stats['q3'],
+            lowerfence=stats['lowerfence'], upperfence=stats['upperfence'],
+            notched=notched, notchspan=stats['notchspan'] if notched else None,
+            name=y, marker_color=color, boxpoints=False, **positions, **kwargs
+        ))
+        fig.add_trace(go.Scatter(
+            x=outliers['key'] if x is not None else [y] * len(outliers), y=outliers['value'],
+            mode='markers', marker_color=color, name='outliers', showlegend=False
+        ))
+        fig.update_layout(title=title, xaxis_title=x, yaxis_title=y)
+        return fig
+
+    def histogram(self, df: DataFrame, x: str, nbins: int = None, text_auto=True, aggregate: bool = None,
+                  aggregate_threshold: int = 100_000, **kwargs) -> go.Figure:
         """
         Histogram
 
@@ -111,21 +174,76 @@ class Plot:
             df (): Dataframe with the data.
             x (): Column to display in the x-axis. (Categorical | Numerical)
             nbins (): Cant of bins to group the data (If x is categorical, ignores this parameter).
-            text_auto (): If False, doesn't show value labels.
-            **kwargs (): Aditional parameters to pass to plotly.express.imshow.
+            text_auto (): If False, doesn't show value labels, a string is used as the format of the labels.
+            aggregate (): If True the counts are computed here, with np.histogram for numerical and datetime data
+                and value_counts for categorical data, and the figure only contains the counts instead of every
+                value. By default only when df has more than aggregate_threshold rows, no kwargs are given and x
+                has one of those types.
+            aggregate_threshold (): Rows above which the data is aggregated when aggregate is None.
+            **kwargs (): Aditional parameters to pass to plotly.express.histogram, or to go.Bar when the data is
+                aggregated.
 
         Returns:
             A Figure that can be displayed with the method show().
         """
+        if aggregate is None:
+            aggregate = len(df) > aggregate_threshold and not kwargs and self._aggregable(df[x])
+        if aggregate:
+            return self._aggregated_histogram(df[x], nbins, text_auto, **kwargs)
         return px.histogram(df, x=x, text_auto=text_auto,
                             color_discrete_sequence=self.color_discrete_sequence,
                             nbins=nbins,
                             **kwargs)
 
+    @staticmethod
+    def _aggregable(column: pd.Series) -> bool:
+        # Numbers and dates are binned, text, categories and booleans are counted, other types go to px.histogram.
+        dtype = column.dtype
+        return (pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_datetime64_any_dtype(dtype)
+                or pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)
+                or isinstance(dtype, pd.CategoricalDtype))
+
+    def _aggregated_histogram(self, column: pd.Series, nbins: int = None, text_auto=True, **kwargs) -> go.Figure:
+        if text_auto is True:
+            kwargs.setdefault('texttemplate', '%{y}')
+        elif text_auto:
+            kwargs.setdefault('texttemplate', f'%{{y:{text_auto}}}')
+        column = column.dropna()
+        numeric = pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column)
+        dates = pd.api.types.is_datetime64_any_dtype(column)
+        if numeric or dates:
+            if dates:
+                # Binned on the nanoseconds since epoch, plotly takes the widths of date bars in milliseconds.
+                tz = column.dt.tz
+                naive = column.dt.tz_convert(None) if tz is not None else column
+                values = naive.astype('datetime64[ns]').to_numpy().view('int64')
+                counts, edges = np.histogram(values, bins=nbins or 'sturges')
+                bounds = pd.to_datetime(np.round(edges).astype('int64'))
+                bounds = bounds.tz_localize('UTC').tz_convert(tz) if tz is not None else bounds
+                centers, widths = bounds[:-1] + (bounds[1:] - bounds[:-1]) / 2, np.diff(edges) / 1e6
+                bounds = bounds.astype(str)
+            else:
+                counts, edges = np.histogram(column.to_numpy(dtype=float), bins=nbins or 'sturges')
+                centers, widths, bounds = (edges[:-1] + edges[1:]) / 2, np.diff(edges), edges
+            kwargs.setdefault('customdata', np.column_stack([bounds[:-1], bounds[1:]]))
+            kwargs.setdefault('hovertemplate', f'{column.name}=[%{{customdata[0]}}, %{{customdata[1]}})'
+                                               f'<br>count=%{{y}}<extra></extra>')
+            bar = go.Bar(x=centers, y=counts, width=widths, **kwargs)
+        else:
+            counts = column.value_counts(sort=False)
+            counts = counts[counts > 0]
+            bar = go.Bar(x=counts.index.astype(str), y=counts.to_numpy(), **kwargs)
+        bar.marker.color = bar.marker.color or self.color_discrete_sequence[0]
+        fig = go.Figure(bar)
+        fig.update_layout(xaxis_title=column.name, yaxis_title='count', bargap=0 if numeric or dates else None)
+        return fig
+
     def scatter(self, df: DataFrame, x: str, y: str, color: str = None, correct_incorrect_map=None,
-                **kwargs) -> go.Figure:
+                webgl_threshold: int = 10_000, max_points: int = 200_000, large_mode: str = 'downsample',
+                bins: int = 200, **kwargs) -> go.Figure:
         """
-        Scatter plot
+        Scatter plot, large inputs are rendered with WebGL and above max_points they are reduced before plotting,
+        so the browser receives at most about max_points points.
 
         Args:
             df (): Dataframe with the data.
@@ -133,12 +251,22 @@ class Plot:
             y (): Column to display in the y-axis. (Numerical).
             color (): Column to separate points by color (Categorical).
             correct_incorrect_map (): A dictionary that maps the columns value to the assigned colors.
-            **kwargs (): Aditional parameters to pass to plotly.express.imshow.
+            webgl_threshold (): Cant of points above which the plot is rendered with WebGL.
+            max_points (): Cant of points above which the data is reduced according to large_mode, None to never
+                reduce it.
+            large_mode (): 'downsample' keeps one point per cell of a grid (and color), so the dense regions are
+                thinned while the outliers and the extremes of each color are kept. 'density' aggregates the points
+                in a grid of bins x bins cells, a heatmap of the counts when color is None, otherwise a point per
+                cell and color sized by its count.
+            bins (): Cells per axis in the density mode.
+            **kwargs (): Aditional parameters to pass to plotly.express.scatter.
 
         Returns:
             A Figure that can be displayed with the method show().
 
         """
+        if large_mode not in ('downsample', 'density'):
+            raise ValueError(f"large_mode must be 'downsample' or 'density', got {large_mode}")
         if correct_incorrect_map is None:
             color_discrete_sequence = self.color_discrete_sequence
             color_discrete_map = None
@@ -148,6 +276,18 @@ class Plot:
                 correct_incorrect_map['correct']: self.colors['correct'],
                 correct_incorrect_map['incorrect']: self.colors['incorrect']
             }
+        reducible = pd.api.types.is_numeric_dtype(df[x]) and pd.api.types.is_numeric_dtype(df[y])
+        if max_points is not None and len(df) > max_points and reducible:
+            if large_mode == 'density' and color is None:
+                return self._density_heatmap(df, x, y, bins, kwargs.get('title'))
+            if large_mode == 'density':
+                df = self._density_points(df, x, y, color, bins)
+                kwargs.setdefault('size', 'count')
+                kwargs.setdefault('hover_data', ['count'])
+            else:
+                df = self._downsample(df, x, y, color, max_points)
+        if len(df) > webgl_threshold:
+            kwargs.setdefault('render_mode', 'webgl')
         return px.scatter(
             data_frame=df,
             x=x,
@@ -156,6 +296,58 @@ class Plot:
             color_discrete_sequence=color_discrete_sequence,
             color_discrete_map=color_discrete_map, **kwargs)
 
+    @staticmethod
+    def _cells(df: DataFrame, x: str, y: str, side: int) -> np.ndarray:
+        """
+        Cell of each row in a grid of side x side cells over the range of x and y, -1 for the rows with nulls.
+        """
+        cells = []
+        for column in (x, y):
+            values = df[column].to_numpy(dtype=float, na_value=np.nan)
+            minimo, maximo = np.nanmin(values), np.nanmax(values)
+            scale = side / (maximo - minimo) if maximo > minimo else 0.0
+            cells.append(np.clip(np.nan_to_num((values - minimo) * scale, nan=-1), -1, side - 1).astype(np.int64))
+        return np.where((cells[0] < 0) | (cells[1] < 0), -1, cells[0] * side + cells[1])
+
+    def _downsample(self, df: DataFrame, x: str, y: str, color: str, max_points: int) -> DataFrame:
+        codes = np.zeros(len(df), dtype=np.int64) if color is None else pd.factorize(df[color])[0].astype(np.int64)
+        groups = int(codes.max()) + 1 if len(codes) else 1
+        side = max(int(np.sqrt(max_points / groups)), 1)
+        cells = self._cells(df, x, y, side)
+        valid = np.flatnonzero(cells >= 0)
+        _, first = np.unique(codes[valid] * side * side + cells[valid], return_index=True)
+        keep = [valid[first]]
+        # The extremes of each color are kept even if they weren't the first point of their cell.
+        for group in range(groups):
+            rows = valid[codes[valid] == group]
+            for column in (x, y):
+                values = df[column].to_numpy(dtype=float, na_value=np.nan)[rows]
+                keep.append(rows[[np.argmin(values), np.argmax(values)]] if len(rows) else rows)
+        return df.iloc[np.unique(np.concatenate(keep))]
+
+    def _density_points(self, df: DataFrame, x: str, y: str, color: str, bins: int) -> DataFrame:
+        cells = self._cells(df, x, y, bins)
+        valid = cells >= 0
+        data = df.loc[valid, [x, y, color]]
+        aggregated = data.groupby([data[color], pd.Series(cells[valid], index=data.index, name='_cell')],
+                                  observed=True, sort=False).agg(**{x: (x, 'mean'), y: (y, 'mean'),
+                                                                    'count': (x, 'size')})
+        return aggregated.reset_index().drop(columns='_cell')
+
+    def _density_heatmap(self, df: DataFrame, x: str, y: str, bins: int, title: str = None) -> go.Figure:
+        data = df[[x, y]].dropna()
+        counts, x_edges, y_edges = np.histogram2d(data[x].to_numpy(dtype=float), data[y].to_numpy(dtype=float),
+                                                  bins=bins)
+        fig = go.Figure(go.Heatmap(
+            x=(x_edges[:-1] + x_edges[1:]) / 2,
+            y=(y_edges[:-1] + y_edges[1:]) / 2,
+            z=np.where(counts > 0, counts, np.nan).T,
+            colorscale=self.color_continuous_scale,
+            colorbar={'title': 'count'}
+        ))
+        fig.update_layout(title=title, xaxis_title=x, yaxis_title=y)
+        return fig
+
     def pyramid(self,
                 df: DataFrame,
                 x: str,
@@ -0,0 +1,21 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.__main__ import main
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_quick(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            output = Path(carpeta).joinpath('bench.json')
+            main(['--quick', '--max-rows', '10000', '--output', str(output)])
+            report = json.loads(output.read_text())
+        benchmarks = {record['benchmark'] for record in report['results']}
+        self.assertIn('procesos.chain_overhead', benchmarks)
+        self.assertTrue(any(benchmark.startswith('visual.') for benchmark in benchmarks))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import contextlib
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from jutils.cache import CacheStore, FileLock, main
+
+
+def _sostener(path, segundos):
+    with FileLock(path):
+        time.sleep(segundos)
+
+
+class TestFileLock(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self._path = Path(self._tmp.name).joinpath('paso.lock')
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def _lease(self, pid, host, antiguedad=0.0):
+        with open(self._path, 'w') as file:
+            json.dump({'pid': pid, 'host': host, 'token': 'otro'}, file)
+        os.utime(self._path, (time.time() - antiguedad,) * 2)
+
+    def test_exclusivo_entre_procesos(self):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(_sostener, self._path, 0.5)
+            while not self._path.exists():
+                time.sleep(0.01)
+            lock = FileLock(self._path)
+            self.assertFalse(lock.acquire(blocking=False))
+            inicio = time.monotonic()
+            with lock:
+                self.assertGreater(time.monotonic() - inicio, 0.2)
+                self.assertTrue(lock.locked)
+            future.result()
+        self.assertFalse(self._path.exists())
+
+    def test_proceso_caido(self):
+        pid = int(subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                                 capture_output=True, text=True).stdout)
+        self._lease(pid, socket.gethostname())
+        with FileLock(self._path, timeout=2):
+            self.assertNotEqual(json.loads(self._path.read_text())['token'], 'otro')
+
+    def test_lease_vencido(self):
+        self._lease(1, 'otro-nodo', antiguedad=5)
+        self.assertTrue(FileLock(self._path, lease=2).acquire(blocking=False))
+        self._lease(1, 'otro-nodo')
+        self.assertFalse(FileLock(self._path, lease=2).acquire(blocking=False))
+        with self.assertRaises(TimeoutError):
+            FileLock(self._path, lease=2, timeout=0.2).acquire()
+
+    def test_cache_compartida(self):
+        store = CacheStore(self._tmp.name, shared=True, timeout=1)
+        with store.lock('abcd'):
+            self.assertTrue(store.path_for('abcd').with_suffix('.lock').exists())
+            store.save('abcd', {'a': 1})
+        self.assertEqual(store.load('abcd'), {'a': 1})
+        self.assertEqual([path.suffix for path in store.path_for('abcd').parent.iterdir()], ['.joblib'])
+
+
+class TestCacheStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self._path = Path(self._tmp.name).joinpath('store')
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    @staticmethod
+    def llenar(store, claves):
+        for clave in claves:
+            store.save(clave, np.zeros(10_000))
+            time.sleep(0.01)
+
+    def test_estadisticas(self):
+        store = CacheStore(self._path)
+        self.llenar(store, ['aa01', 'bb02'])
+        self.assertTrue(store.lookup('aa01'))
+        self.assertFalse(store.lookup('cc03'))
+        stats = store.stats()
+        self.assertEqual((stats['entries'], stats['hits'], stats['misses'], stats['evictions']), (2, 1, 1, 0))
+        self.assertGreater(stats['bytes'], 160_000)
+        self.assertEqual([entry['key'] for entry in store.entries()], ['bb02', 'aa01'])
+        self.assertEqual(CacheStore(self._path).stats()['hit_rate'], 0.5)
+
+    def test_lru(self):
+        store = CacheStore(self._path, max_bytes=200_000)
+        self.llenar(store, ['aa01', 'bb02'])
+        store.lookup('aa01')
+        self.llenar(store, ['cc03'])
+        self.assertEqual([store.contains(clave) for clave in ['aa01', 'bb02', 'cc03']], [True, False, True])
+        self.assertEqual(store.stats()['evictions'], 1)
+
+    def test_total_sin_recorrer(self):
+        store = CacheStore(self._path, max_bytes=450_000)
+        with mock.patch.object(CacheStore, '_entries', autospec=True, side_effect=CacheStore._entries) as entries:
+            self.llenar(store, ['aa01', 'bb02', 'cc03', 'dd04', 'ee05'])
+            self.assertEqual(entries.call_count, 1)
+            store.delete('aa01')
+            self.llenar(store, ['aa01', 'ff06'])
+            self.assertEqual(entries.call_count, 2)
+        self.assertEqual([store.contains(clave) for clave in ['bb02', 'ff06']], [False, True])
+        stats = store.stats()
+        self.assertEqual(json.loads(self._path.joinpath('index.json').read_text())['bytes'], stats['bytes'])
+        self.assertLessEqual(stats['bytes'], 450_000)
+
+    def test_lfu(self):
+        store = CacheStore(self._path)
+        self.llenar(store, ['aa01', 'bb02', 'cc03'])
+        for clave in ['aa01', 'aa01', 'cc03']:
+            store.lookup(clave)
+        with store.lock('cc03'):
+            self.assertEqual(store.prune(170_000, 'lfu'), ['bb02'])
+        self.assertEqual(store.prune(100_000, 'lfu'), ['cc03'])
+        with self.assertRaises(ValueError):
+            CacheStore(self._path, policy='fifo')
+
+    def test_cli(self):
+        store = CacheStore(self._path)
+        self.llenar(store, ['aa01', 'bb02', 'cc03'])
+        salida = io.StringIO()
+        with contextlib.redirect_stdout(salida):
+            main([str(self._path), 'prune', '--max-bytes', '0.1M'])
+            main([str(self._path), 'stats'])
+            main([str(self._path), 'list'])
+        self.assertIn('Evicted 2 entries', salida.getvalue())
+        self.assertIn('evictions: 2', salida.getvalue())
+        self.assertEqual([entry['key'] for entry in store.entries()], ['cc03'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,278 @@
+import tempfile
+import unittest
+from pathlib import Path
+from time import perf_counter, sleep
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from jutils import dtypes, formats
+from jutils.data import DataUtils
+
+
+class TestDataUtils(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self._data_path = Path(self._tmp.name).joinpath('data')
+        for folder in ['raw', 'interim', 'processed']:
+            self._data_path.joinpath(folder).mkdir(parents=True)
+        cant = 1000
+        self.df = pd.DataFrame({
+            'category': np.random.choice(['A', 'B', 'C'], cant),
+            'value': np.random.randint(0, 100, cant),
+            'precio_kg': np.random.rand(cant)
+        })
+        self.df.to_csv(self._data_path.joinpath('raw', 'input.csv'), sep=';', index=False)
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def test_csv_default(self):
+        data_utils = DataUtils(self._data_path, 'input.csv')
+        pd.testing.assert_frame_equal(data_utils.input_data, self.df)
+
+    def test_read_only_view(self):
+        data_utils = DataUtils(self._data_path, 'input.csv')
+        view = data_utils.input_data
+        self.assertTrue(np.shares_memory(view['value'].to_numpy(), data_utils.input_data['value'].to_numpy()))
+        try:
+            view.loc[0, 'value'] = -1
+        except ValueError:
+            pass
+        view['new'] = 1
+        pd.testing.assert_frame_equal(data_utils.input_data, self.df)
+
+    def test_read_only_view_extension_arrays(self):
+        data_utils = DataUtils(self._data_path, 'input.csv', optimize_dtypes=True)
+        expected = data_utils.input_data.copy()
+        self.assertEqual(expected['category'].dtype, 'category')
+        view = data_utils.input_data
+        view.loc[0, 'category'] = 'B' if view.loc[0, 'category'] != 'B' else 'C'
+        pd.testing.assert_frame_equal(data_utils.input_data, expected)
+
+    def test_copy_data(self):
+        data_utils = DataUtils(self._data_path, 'input.csv', copy_data=True)
+        copy = data_utils.input_data
+        copy.loc[0, 'value'] = -1
+        self.assertFalse(np.shares_memory(copy['value'].to_numpy(), data_utils.input_data['value'].to_numpy()))
+        pd.testing.assert_frame_equal(data_utils.input_data, self.df)
+
+    def test_columnar_formats(self):
+        data_utils = DataUtils(self._data_path, 'input.csv', interim_format='feather', processed_format='.parquet')
+        self.assertEqual(data_utils.raw_train_test_path.suffix, '.feather')
+        self.assertEqual(data_utils.transformed_train_test_path.suffix, '.parquet')
+        self.assertEqual(data_utils.transformed_validation_path.name, 'input_validation_processed.parquet')
+        for suffix in ['.parquet', '.feather', '.arrow', '.pkl']:
+            path = self._data_path.joinpath('interim', 'frame' + suffix)
+            formats.write_frame(self.df, path)
+            pd.testing.assert_frame_equal(formats.read_frame(path), self.df)
+
+    def test_chunks(self):
+        for suffix in ['.csv', '.parquet', '.feather', '.pkl']:
+            data_utils = DataUtils(self._data_path, 'input.csv', interim_format=suffix, processed_format=suffix)
+            chunks = list(data_utils.iter_input_chunks(chunksize=300))
+            self.assertEqual([len(chunk) for chunk in chunks], [300, 300, 300, 100])
+            data_utils.save_chunks(chunks, data_utils.transformed_train_test_path)
+            chunks = list(data_utils.iter_train_test_chunks(chunksize=450))
+            self.assertEqual([len(chunk) for chunk in chunks], [450, 450, 100])
+            pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), self.df)
+
+    def test_chunks_empty_first(self):
+        df = self.df.astype({'category': object})
+        for suffix in ['.parquet', '.feather', '.arrow']:
+            path = self._data_path.joinpath('interim', 'frame' + suffix)
+            formats.write_chunks([df.iloc[:0], df.iloc[:500], df.iloc[:0], df.iloc[500:]], path)
+            pd.testing.assert_frame_equal(formats.read_frame(path), self.df)
+            formats.write_chunks([df.iloc[:0]], path)
+            self.assertEqual(list(formats.read_frame(path).columns), list(self.df.columns))
+
+    def test_parse_cache(self):
+        calls = []
+
+        def load_data(path):
+            calls.append(path)
+            return formats.read_frame(path)
+
+        data_utils = DataUtils(self._data_path, 'input.csv', load_data=load_data, parse_cache=True)
+        pd.testing.assert_frame_equal(data_utils.input_data, self.df)
+        self.assertEqual(len(list(data_utils.parse_cache_path.iterdir())), 1)
+        data_utils = DataUtils(self._data_path, 'input.csv', load_data=load_data, parse_cache=True)
+        pd.testing.assert_frame_equal(data_utils.input_data, self.df)
+        self.assertEqual(len(calls), 1)
+        self.df.head(10).to_csv(data_utils.input_file_path, sep=';', index=False)
+        data_utils = DataUtils(self._data_path, 'input.csv', load_data=load_data, parse_cache=True)
+        self.assertEqual(len(data_utils.input_data), 10)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(list(data_utils.parse_cache_path.iterdir())), 1)
+
+    def test_parse_cache_dotted_name(self):
+        self.df.to_csv(self._data_path.joinpath('raw', 'sales.2023.csv'), sep=';', index=False)
+        data_utils = DataUtils(self._data_path, 'sales.2023.csv', parse_cache=True)
+        pd.testing.assert_frame_equal(data_utils.load(data_utils.input_file_path), self.df)
+        self.assertEqual(list(data_utils.load(data_utils.input_file_path, columns=['value']).columns), ['value'])
+        self.assertEqual(len(list(data_utils.parse_cache_path.iterdir())), 2)
+        self.df.head(10).to_csv(data_utils.input_file_path, sep=';', index=False)
+        pd.testing.assert_frame_equal(data_utils.load(data_utils.input_file_path), self.df.head(10))
+
+    def test_optimize_dtypes(self):
+        data_utils = DataUtils(self._data_path, 'input.csv', optimize_dtypes=True)
+        df = data_utils.input_data
+        self.assertEqual(df['category'].dtype, 'category')
+        self.assertEqual(df['value'].dtype, 'uint8')
+        self.assertEqual(df['precio_kg'].dtype, 'float64')
+        pd.testing.assert_frame_equal(df, self.df, check_dtype=False, check_categorical=False)
+        report = data_utils.dtype_reports[data_utils.input_file_path]
+        self.assertGreater(report.loc['value', 'bytes_saved'], 0)
+        schema_file = data_utils.schema_path(data_utils.input_file_path)
+        self.assertEqual(schema_file.parent, data_utils.interim_path)
+        schema = dtypes.load_schema(schema_file)
+        schema['value'] = 'int16'
+        dtypes.save_schema(schema, schema_file)
+        data_utils = DataUtils(self._data_path, 'input.csv', optimize_dtypes=True)
+        self.assertEqual(data_utils.input_data['value'].dtype, 'int16')
+
+    def test_optimize_dtypes_fractional(self):
+        whole = pd.DataFrame({'value': [1.0, 2.0, 3.0], 'precio_kg': [10.0, 20.0, 30.0]})
+        whole.to_csv(self._data_path.joinpath('raw', 'input.csv'), sep=';', index=False)
+        data_utils = DataUtils(self._data_path, 'input.csv', optimize_dtypes=True)
+        self.assertEqual(data_utils.input_data['value'].dtype, 'uint8')
+        fractional = pd.DataFrame({'value': [1.5, 2.7, 3.9], 'precio_kg': [10.25, 20.5, 30.75]})
+        fractional.to_csv(data_utils.input_file_path, sep=';', index=False)
+        data_utils = DataUtils(self._data_path, 'input.csv', optimize_dtypes=True)
+        pd.testing.assert_frame_equal(data_utils.input_data, fractional, check_dtype=False)
+        self.assertEqual(dtypes.load_schema(data_utils.schema_path(data_utils.input_file_path))['value'], 'float64')
+        with self.assertRaises(ValueError):
+            dtypes.apply_schema(fractional, {'value': 'uint8'})
+
+    def test_infer_dtype(self):
+        self.assertEqual(dtypes.infer_dtype(pd.Series([1.0, None, 300.0])), 'UInt16')
+        self.assertEqual(dtypes.infer_dtype(pd.Series([-1, 2, 3])), 'int8')
+        self.assertEqual(dtypes.infer_dtype(pd.Series([0.5, 0.25])), 'float32')
+        with self.assertRaises(ValueError):
+            dtypes.apply_schema(pd.DataFrame({'a': [1000]}), {'a': 'int8'})
+
+    def test_columns_and_filters(self):
+        columns = ['value', 'precio_kg']
+        filters = [('category', 'in', ['A', 'B']), ('value', '>=', 50)]
+        expected = self.df.loc[self.df['category'].isin(['A', 'B']) & (self.df['value'] >= 50), columns]
+        expected = expected.reset_index(drop=True)
+        for suffix in ['.csv', '.parquet', '.feather', '.arrow', '.pkl']:
+            path = self._data_path.joinpath('interim', 'frame' + suffix)
+            formats.write_frame(self.df, path)
+            pd.testing.assert_frame_equal(formats.read_frame(path, columns, filters), expected)
+            chunks = list(formats.read_chunks(path, 100, columns, filters))
+            pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected)
+        data_utils = DataUtils(self._data_path, 'input.csv', columns=columns, filters=filters)
+        pd.testing.assert_frame_equal(data_utils.input_data, expected)
+        data_utils = DataUtils(self._data_path, 'input.csv', load_data=lambda path: pd.read_csv(path, sep=';'),
+                               load_chunks=lambda path, chunksize: pd.read_csv(path, sep=';', chunksize=chunksize))
+        pd.testing.assert_frame_equal(data_utils.load(data_utils.input_file_path, columns, filters), expected)
+        chunks = data_utils.iter_chunks(data_utils.input_file_path, 100, columns, filters)
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected)
+
+    def test_prefetch(self):
+        calls = []
+
+        def load_data(path):
+            start = perf_counter()
+            sleep(0.2)
+            frame = formats.read_frame(path)
+            calls.append((start, perf_counter()))
+            return frame
+
+        data_utils = DataUtils(self._data_path, 'input.csv', load_data=load_data)
+        data_utils.save_data(self.df, data_utils.transformed_train_test_path)
+        data_utils.save_data(self.df, data_utils.transformed_validation_path)
+        futures = data_utils.prefetch_async('train_test_data', 'validation_data')
+        pd.testing.assert_frame_equal(data_utils.train_test_data, self.df)
+        pd.testing.assert_frame_equal(data_utils.validation_data, self.df)
+        self.assertEqual(len(calls), 2)
+        (first_start, first_end), (second_start, second_end) = calls
+        self.assertTrue(first_start < second_end and second_start < first_end)
+        self.assertTrue(all(future.done() for future in futures.values()))
+        with self.assertRaises(FileNotFoundError):
+            data_utils.prefetch('model')
+        with self.assertRaises(ValueError):
+            data_utils.prefetch('data')
+
+    def test_split_train_validation(self):
+        data_utils = DataUtils(self._data_path, 'input.csv', interim_format='.parquet')
+        train_test_rows, validation_rows = data_utils.split_train_validation(0.25, chunksize=100)
+        train_test = formats.read_frame(data_utils.raw_train_test_path)
+        validation = formats.read_frame(data_utils.raw_validation_path)
+        self.assertEqual((len(train_test), len(validation)), (train_test_rows, validation_rows))
+        self.assertEqual(train_test_rows + validation_rows, len(self.df))
+        self.assertTrue(150 < validation_rows < 350)
+        data_utils = DataUtils(self._data_path, 'input.csv')
+        data_utils.split_train_validation(0.5, key='category', chunksize=70)
+        train_test = formats.read_frame(data_utils.raw_train_test_path)
+        validation = formats.read_frame(data_utils.raw_validation_path)
+        self.assertFalse(set(train_test['category']) & set(validation['category']))
+        self.assertEqual(len(train_test) + len(validation), len(self.df))
+
+    def test_split_train_validation_columns(self):
+        data_utils = DataUtils(self._data_path, 'input.csv', columns=['value', 'precio_kg'],
+                               filters=[('value', '<', 50)])
+        data_utils.split_train_validation(0.5, key='category', chunksize=300)
+        train_test = formats.read_frame(data_utils.raw_train_test_path)
+        validation = formats.read_frame(data_utils.raw_validation_path)
+        self.assertEqual(list(train_test.columns), list(self.df.columns))
+        self.assertEqual(len(train_test) + len(validation), len(self.df))
+
+    def test_split_train_validation_empty_slices(self):
+        def load_chunks(path, chunksize):
+            for chunk in formats.read_chunks(path, chunksize):
+                yield chunk.astype({'category': object})
+
+        for suffix in ['.parquet', '.feather']:
+            data_utils = DataUtils(self._data_path, 'input.csv', interim_format=suffix, load_chunks=load_chunks)
+            train_test_rows, validation_rows = data_utils.split_train_validation(0.01, seed=1, chunksize=20)
+            train_test = formats.read_frame(data_utils.raw_train_test_path)
+            validation = formats.read_frame(data_utils.raw_validation_path)
+            self.assertEqual((len(train_test), len(validation)), (train_test_rows, validation_rows))
+            self.assertEqual(train_test_rows + validation_rows, len(self.df))
+            self.assertEqual(list(validation.columns), list(self.df.columns))
+
+    def test_model(self):
+        data_utils = DataUtils(self._data_path, 'input.csv')
+        data_utils.model = {'coef': np.arange(10)}
+        data_utils.model = {'coef': np.arange(20)}
+        self.assertEqual(data_utils.model_store.versions(), [1, 2])
+        self.assertEqual(len(DataUtils(self._data_path, 'input.csv').model['coef']), 20)
+        self.assertEqual(len(DataUtils(self._data_path, 'input.csv', model_version=1).model['coef']), 10)
+
+    def test_legacy_model(self):
+        data_utils = DataUtils(self._data_path, 'input.csv')
+        joblib.dump({'coef': np.arange(5)}, data_utils.models_path)
+        self.assertEqual(len(data_utils.model['coef']), 5)
+        self.assertEqual(data_utils.model_store.versions(), [1])
+        data_utils.model = {'coef': np.arange(10)}
+        self.assertEqual(data_utils.model_store.versions(), [1, 2])
+        self.assertEqual(len(DataUtils(self._data_path, 'input.csv', model_version=1).model['coef']), 5)
+
+    def test_stats(self):
+        records = []
+        data_utils = DataUtils(self._data_path, 'input.csv', processed_format='.parquet', hooks=[records.append])
+        data_utils.save_data(self.df, data_utils.transformed_train_test_path)
+        data_utils.save_chunks([self.df, self.df], data_utils.transformed_validation_path)
+        self.assertEqual(len(list(data_utils.iter_train_test_chunks(300))), 4)
+        data_utils.train_test_data
+        data_utils.model = {'coef': np.arange(1000)}
+        stats = data_utils.stats()
+        self.assertEqual(list(stats['operation']), ['save', 'save_chunks', 'load_chunks', 'load', 'save_model'])
+        self.assertEqual(list(stats['rows'][:4]), [1000, 2000, 1000, 1000])
+        self.assertTrue((stats['bytes'] > 0).all())
+        self.assertEqual(len(records), 5)
+        report = data_utils.memory_report().set_index('artifact')
+        self.assertEqual(list(report.index), ['train_test_data', 'model'])
+        self.assertGreaterEqual(report.loc['model', 'memory'], 8000)
+
+    def test_train_test_data(self):
+        data_utils = DataUtils(self._data_path, 'input.csv', processed_format='.parquet')
+        data_utils.save_data(self.df, data_utils.transformed_train_test_path)
+        pd.testing.assert_frame_equal(data_utils.train_test_data, self.df)
+
+
+if __name__ == '__main__':
+    unittest.main()
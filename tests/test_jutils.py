@@ -60,6 +60,42 @@ class TestJutils(unittest.TestCase):
         """"""
         self.plot.box(self.df, x='value1', y='value2').show()
 
+    def test_box_kwargs(self):
+        """"""
+        figure = self.plot.box(self.df, x='category2', y='value1', color='category1', hover_data=['category3'])
+        self.assertEqual(sorted(trace.name for trace in figure.data), ['F', 'M'])
+
+    def test_box_aggregated(self):
+        """"""
+        cant = 200_000
+        df = pd.DataFrame({
+            'category2': np.random.choice(['A', 'B', 'C'], cant),
+            'value1': np.random.randint(-1200, 4000, cant),
+            'value2': np.random.standard_cauchy(cant)
+        })
+        figure = self.plot.box(df, x='category2', y='value2', max_outliers=50)
+        box, outliers = figure.data
+        self.assertEqual(box.type, 'box')
+        for position, category in enumerate(box.x):
+            values = df.loc[df['category2'] == category, 'value2']
+            q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+            self.assertAlmostEqual(box.q1[position], q1)
+            self.assertAlmostEqual(box.median[position], median)
+            self.assertAlmostEqual(box.q3[position], q3)
+            self.assertEqual(box.upperfence[position], values[values <= q3 + 1.5 * (q3 - q1)].max())
+            group = np.array(outliers.y)[np.array(outliers.x) == category]
+            self.assertLessEqual(len(group), 51)
+            self.assertEqual(group.max(), values.max())
+            self.assertEqual(group.min(), values.min())
+        size = len(figure.to_json())
+        larger = self.plot.box(pd.concat([df] * 3), x='category2', y='value2', max_outliers=50)
+        self.assertLess(abs(len(larger.to_json()) - size), size * 0.1)
+        binned = self.plot.box(df, x='value1', y='value2', nbins=5)
+        self.assertEqual(len(binned.data[0].x), 4)
+        self.assertEqual(len(self.plot.box(df, y='value2', notched=True).data[0].q1), 1)
+        self.assertEqual(self.plot.box(df, x='category2', y='value2', points=False).data[0].type, 'box')
+        self.assertIsNone(self.plot.box(df, x='category2', y='value2', points=False).data[0].q1)
+
     @paciencia
     def test_histogram(self):
         """"""
@@ -72,11 +108,74 @@ class TestJutils(unittest.TestCase):
         self.plot.histogram(self.df, x='value1', nbins=5).show()
         self.plot.histogram(self.df, x='category2', nbins=5).show()
 
+    def test_histogram_aggregated(self):
+        """"""
+        cant = 200_000
+        df = pd.DataFrame({
+            'category2': np.random.choice(['A', 'B', 'C'], cant),
+            'value1': np.random.randint(-1200, 4000, cant)
+        })
+        figure = self.plot.histogram(df, x='value1', nbins=20)
+        bar = figure.data[0]
+        self.assertEqual(bar.type, 'bar')
+        self.assertEqual(len(bar.x), 20)
+        self.assertEqual(sum(bar.y), cant)
+        self.assertEqual(list(bar.y), list(np.histogram(df['value1'], bins=20)[0]))
+        self.assertEqual(bar.texttemplate, '%{y}')
+        size = len(figure.to_json())
+        larger = self.plot.histogram(pd.concat([df] * 3), x='value1', nbins=20)
+        self.assertLess(abs(len(larger.to_json()) - size), size * 0.1)
+        categorical = self.plot.histogram(df, x='category2', text_auto='.2s').data[0]
+        self.assertEqual(dict(zip(categorical.x, categorical.y)), df['category2'].value_counts().to_dict())
+        self.assertEqual(categorical.texttemplate, '%{y:.2s}')
+        self.assertIsNone(self.plot.histogram(df, x='category2', text_auto=False).data[0].texttemplate)
+        self.assertEqual(self.plot.histogram(df.head(1000), x='value1').data[0].type, 'histogram')
+
+    def test_histogram_aggregated_dates(self):
+        """"""
+        cant = 200_000
+        seconds = np.random.randint(0, 365 * 24 * 3600, cant)
+        df = pd.DataFrame({'date': pd.Timestamp('2023-01-01') + pd.to_timedelta(seconds, unit='s')})
+        figure = self.plot.histogram(df, x='date', nbins=20)
+        bar = figure.data[0]
+        self.assertEqual(bar.type, 'bar')
+        self.assertEqual(len(bar.x), 20)
+        self.assertEqual(sum(bar.y), cant)
+        self.assertLess(len(figure.to_json()), 20_000)
+        local = self.plot.histogram(df.assign(date=df['date'].dt.tz_localize('America/Bogota')), x='date', nbins=20)
+        self.assertEqual(list(local.data[0].y), list(bar.y))
+
     @paciencia
     def test_scatter(self):
         """"""
         self.plot.scatter(self.df, x='value1', y='value2', color='category2').show()
 
+    def test_scatter_large(self):
+        """"""
+        cant = 300_000
+        df = pd.DataFrame({
+            'value1': np.random.normal(size=cant),
+            'value2': np.random.normal(size=cant),
+            'result': np.random.choice(['ok', 'ko'], cant)
+        })
+        figure = self.plot.scatter(df, x='value1', y='value2', color='result',
+                                   correct_incorrect_map={'correct': 'ok', 'incorrect': 'ko'})
+        self.assertEqual({trace.type for trace in figure.data}, {'scattergl'})
+        self.assertLessEqual(sum(len(trace.x) for trace in figure.data), 200_000)
+        self.assertEqual({trace.name: trace.marker.color for trace in figure.data},
+                         {'ok': self.plot.colors['correct'], 'ko': self.plot.colors['incorrect']})
+        for trace in figure.data:
+            group = df[df['result'] == trace.name]
+            self.assertEqual(max(trace.x), group['value1'].max())
+            self.assertEqual(min(trace.y), group['value2'].min())
+        density = self.plot.scatter(df, x='value1', y='value2', large_mode='density', bins=50)
+        self.assertEqual(density.data[0].type, 'heatmap')
+        self.assertEqual(np.nansum(np.array(density.data[0].z, dtype=float)), cant)
+        density = self.plot.scatter(df, x='value1', y='value2', color='result', large_mode='density', bins=50)
+        self.assertEqual(sum(sum(trace.marker.size) for trace in density.data), cant)
+        webgl = self.plot.scatter(df.head(20_000), x='value1', y='value2', max_points=None)
+        self.assertEqual(len(webgl.data[0].x), 20_000)
+
     @paciencia
     def test_pyramid(self):
         """"""
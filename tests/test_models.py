@@ -0,0 +1,38 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from jutils.models import ModelStore
+
+
+class TestModelStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self._path = Path(self._tmp.name).joinpath('models')
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def test_versions(self):
+        store = ModelStore(self._path, cache_size=1)
+        self.assertEqual(store.save({'coef': np.arange(10)}), 1)
+        self.assertEqual(store.save({'coef': np.arange(20)}), 2)
+        compressed = ModelStore(self._path, compress=3, mmap_mode=None)
+        self.assertEqual(compressed.save({'coef': np.arange(5)}, name='other'), 1)
+        self.assertEqual(store.versions(), [1, 2])
+        self.assertEqual(len(store.load(version=1)['coef']), 10)
+        self.assertEqual(len(store._cache), 1)
+        compressed.clear_cache()
+        self.assertEqual(len(compressed.load(name='other')['coef']), 5)
+
+    def test_mmap(self):
+        ModelStore(self._path).save({'coef': np.arange(100_000)})
+        model = ModelStore(self._path).load()
+        self.assertIsInstance(model['coef'], np.memmap)
+        self.assertIs(ModelStore(self._path, mmap_mode=None).load()['coef'].__class__, np.ndarray)
+
+
+if __name__ == '__main__':
+    unittest.main()
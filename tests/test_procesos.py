@@ -1,43 +1,45 @@
+import asyncio
+import json
+import pickle
+import tempfile
+import tracemalloc
 import unittest
-from time import sleep
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter, sleep
 from pathlib import Path
+from unittest import mock
 
-from jutils.procesos import Proceso, Paso
+import joblib
+import numpy as np
+import pandas as pd
+
+from jutils.cache import CacheStore
+from jutils.perfilador import Perfilador
+from jutils.procesos import Planificador, Proceso, Paso, PasoIncremental, PasoParticionado
 
 
 class Paso1(Paso):
     def _run(self, a) -> dict:
         super()._run()
-        print("Haciendo algo pesado")
-        sleep(10)
-        print("Terminando de hacer algo pesado")
         return {"paso1": a * 4}
 
 
 class Paso2(Paso):
     def _run(self, paso1) -> dict:
         super()._run()
-        print("Haciendo algo pesado")
-        sleep(10)
-        print("Terminando de hacer algo pesado")
         return {"paso2": paso1 + 6}
 
 
 class Paso3(Paso):
     def _run(self, paso2) -> dict:
         super()._run()
-        print("Haciendo algo pesado")
-        sleep(10)
-        print("Terminando de hacer algo pesado")
         return {"paso3": paso2 ** 2}
 
 
 class Paso4(Paso):
     def _run(self, paso3) -> dict:
         super()._run()
-        print("Haciendo algo pesado")
-        sleep(10)
-        print("Terminando de hacer algo pesado")
         return {"paso4": paso3 - 10}
 
 
@@ -80,6 +82,551 @@ class Procesamiento(Proceso):
         return r
 
 
+ejecuciones = Counter()
+intervalos = {}
+
+
+def solapados(primero, segundo):
+    return intervalos[primero][0] < intervalos[segundo][1] and intervalos[segundo][0] < intervalos[primero][1]
+
+
+class Entrada(Paso):
+    def _run(self, a) -> dict:
+        ejecuciones[self._nombre] += 1
+        return {"entrada": a}
+
+
+class Rama(Paso):
+    def __init__(self, nombre, paso_anterior=None, factor=1, espera=0.0, cache=None):
+        super().__init__(nombre, paso_anterior, cache)
+        self.factor = factor
+        self.espera = espera
+
+    def _run(self, entrada) -> dict:
+        ejecuciones[self._nombre] += 1
+        inicio = perf_counter()
+        sleep(self.espera)
+        intervalos[self._nombre] = (inicio, perf_counter())
+        return {self._nombre: entrada * self.factor}
+
+
+class Combinar(Paso):
+    def _run(self, izquierda, derecha) -> dict:
+        ejecuciones[self._nombre] += 1
+        return {"union": izquierda + derecha}
+
+
+def diamante(espera=0.0, cache=None, factor=2):
+    entrada = Entrada("entrada", cache=cache)
+    izquierda = Rama("izquierda", entrada, factor=factor, espera=espera, cache=cache)
+    derecha = Rama("derecha", entrada, factor=3, espera=espera, cache=cache)
+    return Combinar("union", [izquierda, derecha], cache=cache)
+
+
+class TestGrafo(unittest.TestCase):
+    def test_varios_pasos_anteriores(self):
+        self.assertEqual(diamante().run(a=5), {"union": 25})
+
+    def test_planificador_hilos(self):
+        union = diamante(espera=0.3)
+        self.assertEqual(union.run(planificador=Planificador(max_workers=2), a=5), {"union": 25})
+        self.assertTrue(solapados("izquierda", "derecha"))
+
+    def test_planificador_procesos(self):
+        union = diamante()
+        self.assertEqual(union.run(planificador=Planificador(max_workers=2, procesos=True), a=5), {"union": 25})
+        self.assertEqual(union.pasos_anteriores[0].run(), {"izquierda": 10})
+
+
+class TestCacheContenido(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self._cache = Path(self._tmp.name)
+        ejecuciones.clear()
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def test_reutiliza_pasos_sin_cambios(self):
+        self.assertEqual(diamante(cache=self._cache).run(a=5), {"union": 25})
+        self.assertEqual(diamante(cache=self._cache).run(a=5), {"union": 25})
+        self.assertEqual(sum(ejecuciones.values()), 4)
+        self.assertEqual(diamante(cache=self._cache, factor=4).run(a=5), {"union": 35})
+        self.assertEqual(ejecuciones, Counter(entrada=1, izquierda=2, derecha=1, union=2))
+
+    def test_estadisticas_y_limite(self):
+        store = CacheStore(self._cache)
+        diamante(cache=store).run(a=5)
+        diamante(cache=store).run(a=5)
+        self.assertEqual((store.stats()['hits'], store.stats()['misses']), (1, 4))
+        store.prune(0)
+        self.assertEqual(diamante(cache=store).run(a=5), {"union": 25})
+        self.assertEqual(ejecuciones, Counter(entrada=2, izquierda=2, derecha=2, union=2))
+
+    def test_invalida_con_nuevas_entradas(self):
+        union = diamante(cache=self._cache)
+        self.assertEqual(union.run(a=5), {"union": 25})
+        self.assertEqual(union.run(a=1), {"union": 5})
+        self.assertEqual(union.run(planificador=Planificador(), a=5), {"union": 25})
+        self.assertEqual(ejecuciones, Counter(entrada=2, izquierda=2, derecha=2, union=2))
+
+    def test_hashea_una_vez_por_ejecucion(self):
+        ejecutar = [
+            lambda union: union.run(a=5),
+            lambda union: union.run(planificador=Planificador(max_workers=2), a=5),
+            lambda union: asyncio.run(union.run_async(a=5))
+        ]
+        for numero, run in enumerate(ejecutar):
+            with self.subTest(numero=numero):
+                union = diamante(cache=CacheStore(self._cache.joinpath(str(numero)), shared=True))
+                with mock.patch('jutils.procesos.joblib.hash', wraps=joblib.hash) as hash_:
+                    self.assertEqual(run(union), {"union": 25})
+                # Las entradas y una clave por cada uno de los cuatro pasos.
+                self.assertEqual(hash_.call_count, 5)
+
+
+class TestConcurrencia(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self._path = Path(self._tmp.name).joinpath('concurrente.pkl')
+        ejecuciones.clear()
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def test_una_ejecucion_por_paso(self):
+        proceso = Proceso(cached=True, cache_path=self._path)
+        proceso.union = diamante(espera=0.2)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            respuestas = list(executor.map(lambda _: proceso.run(proceso.union, a=5), range(8)))
+        self.assertEqual(respuestas, [{"union": 25}] * 8)
+        self.assertEqual(ejecuciones, Counter(entrada=1, izquierda=1, derecha=1, union=1))
+        self.assertEqual(sorted(archivo.suffix for archivo in proceso._cache_dir.iterdir()), ['.joblib'] * 4)
+        self.assertEqual(Proceso.from_cache(None, True, self._path).union.run(a=5), {"union": 25})
+
+    def test_planificador_concurrente(self):
+        union = diamante(espera=0.2)
+        planificador = Planificador(max_workers=2)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            respuestas = list(executor.map(lambda _: union.run(planificador=planificador, a=5), range(4)))
+        self.assertEqual(respuestas, [{"union": 25}] * 4)
+        self.assertEqual(sum(ejecuciones.values()), 4)
+
+    def test_serializable(self):
+        union = pickle.loads(pickle.dumps(diamante()))
+        self.assertEqual(union.run(a=5), {"union": 25})
+
+
+class Registrado(Paso):
+    def __init__(self, nombre, paso_anterior=None, registro=None, cache=None):
+        super().__init__(nombre, paso_anterior, cache)
+        self.registro = registro
+
+    def _run(self, **kwargs) -> dict:
+        with open(self.registro, 'a') as archivo:
+            archivo.write(f'{self._nombre}\n')
+        sleep(0.3)
+        return {self._nombre: sum(kwargs.values())}
+
+
+def grafo_registrado(registro, cache=None):
+    a = Registrado("a", registro=registro, cache=cache)
+    b = Registrado("b", a, registro=registro, cache=cache)
+    c = Registrado("c", a, registro=registro, cache=cache)
+    return Registrado("d", [b, c], registro=registro, cache=cache)
+
+
+def trabajador_cache(carpeta, planificador):
+    cache = CacheStore(Path(carpeta).joinpath('cache'), shared=True)
+    d = grafo_registrado(Path(carpeta).joinpath('registro.txt'), cache)
+    return d.run(planificador=Planificador(max_workers=2) if planificador else None, x=1)
+
+
+def trabajador_proceso(carpeta):
+    proceso = Proceso(cached=True, cache_path=Path(carpeta).joinpath('proceso.pkl'), compartido=True)
+    proceso.d = grafo_registrado(Path(carpeta).joinpath('registro.txt'))
+    proceso = Proceso.from_cache(proceso, True, proceso._cache_path)
+    return proceso.run(proceso.d, x=1)
+
+
+def trabajador_proceso_store(carpeta):
+    proceso = Proceso(cached=True, cache_path=Path(carpeta).joinpath('proceso.pkl'), compartido=True)
+    cache = CacheStore(Path(carpeta).joinpath('cache'), shared=True)
+    proceso.d = grafo_registrado(Path(carpeta).joinpath('registro.txt'), cache)
+    return proceso.run(proceso.d, x=1)
+
+
+def trabajador_proceso_async(carpeta):
+    proceso = Proceso(cached=True, cache_path=Path(carpeta).joinpath('proceso.pkl'), compartido=True)
+    cache = CacheStore(Path(carpeta).joinpath('cache'), shared=True)
+    proceso.d = grafo_registrado(Path(carpeta).joinpath('registro.txt'), cache)
+    return asyncio.run(proceso.run_async(proceso.d, x=1))
+
+
+class Bloqueado(Paso):
+    def __init__(self, nombre, bloqueo, cache=None):
+        super().__init__(nombre, cache=cache)
+        self.bloqueo = bloqueo
+
+    def _run(self) -> dict:
+        return {"bloqueado": Path(self.bloqueo).exists()}
+
+
+class TestCacheCompartida(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self._carpeta = Path(self._tmp.name)
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def ejecuciones(self):
+        return Counter(self._carpeta.joinpath('registro.txt').read_text().split())
+
+    def test_cache_store_compartido(self):
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            respuestas = list(executor.map(trabajador_cache, [self._carpeta] * 4, [False, True, False, True]))
+        self.assertEqual(respuestas, [{"d": 2}] * 4)
+        self.assertEqual(self.ejecuciones(), Counter(a=1, b=1, c=1, d=1))
+        self.assertEqual(list(self._carpeta.joinpath('cache').rglob('*.lock')), [])
+
+    def test_proceso_compartido(self):
+        with ProcessPoolExecutor(max_workers=3) as executor:
+            respuestas = list(executor.map(trabajador_proceso, [self._carpeta] * 3))
+        self.assertEqual(respuestas, [{"d": 2}] * 3)
+        self.assertEqual(self.ejecuciones(), Counter(a=1, b=1, c=1, d=1))
+        self.assertEqual(len(list(self._carpeta.joinpath('proceso_pasos').iterdir())), 4)
+
+    def test_proceso_compartido_cache_store(self):
+        with ProcessPoolExecutor(max_workers=3) as executor:
+            respuestas = list(executor.map(trabajador_proceso_store, [self._carpeta] * 3))
+        self.assertEqual(respuestas, [{"d": 2}] * 3)
+        self.assertEqual(self.ejecuciones(), Counter(a=1, b=1, c=1, d=1))
+
+    def test_proceso_compartido_async(self):
+        with ProcessPoolExecutor(max_workers=3) as executor:
+            respuestas = list(executor.map(trabajador_proceso_async, [self._carpeta] * 3))
+        self.assertEqual(respuestas, [{"d": 2}] * 3)
+        self.assertEqual(self.ejecuciones(), Counter(a=1, b=1, c=1, d=1))
+
+    def test_bloqueo_proceso(self):
+        ruta = self._carpeta.joinpath('proceso.pkl')
+        bloqueo = ruta.with_name('proceso.pkl.lock')
+        proceso = Proceso(cached=True, cache_path=ruta, compartido=True)
+        self.assertEqual(proceso.run(Bloqueado("sin_store", bloqueo)), {"bloqueado": True})
+        cache = CacheStore(self._carpeta.joinpath('cache'), shared=True)
+        self.assertEqual(proceso.run(Bloqueado("con_store", bloqueo, cache)), {"bloqueado": False})
+
+
+class Espera(Paso):
+    def __init__(self, nombre, paso_anterior=None, espera=0.2):
+        super().__init__(nombre, paso_anterior)
+        self.espera = espera
+
+    async def _run(self, entrada) -> dict:
+        ejecuciones[self._nombre] += 1
+        inicio = perf_counter()
+        await asyncio.sleep(self.espera)
+        intervalos[self._nombre] = (inicio, perf_counter())
+        return {self._nombre: entrada}
+
+
+class TestAsync(unittest.TestCase):
+    def setUp(self) -> None:
+        ejecuciones.clear()
+
+    def test_ramas_concurrentes(self):
+        entrada = Entrada("entrada")
+        union = Combinar("union", [Espera("izquierda", entrada), Espera("derecha", entrada)])
+        self.assertEqual(asyncio.run(union.run_async(a=5)), {"union": 10})
+        self.assertTrue(solapados("izquierda", "derecha"))
+        self.assertEqual(ejecuciones, Counter(entrada=1, izquierda=1, derecha=1, union=1))
+
+    def test_proceso_async(self):
+        entrada = Entrada("entrada")
+        proceso = Proceso()
+        self.assertEqual(asyncio.run(proceso.run_async(Espera("espera", entrada, 0), a=2)), {"espera": 2})
+
+    def test_paso_async_sincrono(self):
+        self.assertEqual(Espera("espera", Entrada("entrada"), 0).run(a=3), {"espera": 3})
+
+
+class TestPerfilador(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self._cache = Path(self._tmp.name)
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def test_reporte(self):
+        with Perfilador(memoria=True) as perfilador:
+            diamante(cache=self._cache).run(a=5)
+            diamante(cache=self._cache).run(a=5)
+        reporte = perfilador.reporte()
+        self.assertEqual(list(reporte['estado']), ['ejecutado', 'ejecutado', 'memoria', 'ejecutado', 'ejecutado', 'cache'])
+        ejecutados = reporte[reporte['estado'] == 'ejecutado']
+        self.assertTrue((ejecutados['bytes_respuesta'] > 0).all())
+        self.assertTrue(ejecutados['memoria_pico'].notna().all())
+        self.assertEqual(perfilador.resumen().loc['union', 'aciertos'], 1)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_memoria_hilos(self):
+        with Perfilador(memoria=True) as perfilador:
+            diamante(espera=0.3).run(planificador=Planificador(max_workers=2), a=5)
+        self.assertTrue(solapados("izquierda", "derecha"))
+        picos = perfilador.reporte().set_index('nombre')['memoria_pico']
+        self.assertTrue(picos[['izquierda', 'derecha']].isna().all())
+        self.assertTrue(picos[['entrada', 'union']].notna().all())
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_chrome_trace(self):
+        perfilador = Perfilador()
+        proceso = Proceso(planificador=Planificador(max_workers=2), perfilador=perfilador)
+        proceso.run(diamante(espera=0.05), a=5)
+        asyncio.run(Proceso(perfilador=perfilador).run_async(Espera("espera", Entrada("entrada"), 0), a=1))
+        ruta = self._cache.joinpath('traza.json')
+        perfilador.exportar_chrome_trace(ruta)
+        with open(ruta) as archivo:
+            eventos = json.load(archivo)['traceEvents']
+        self.assertEqual([evento['ph'] for evento in eventos], ['X'] * 6)
+        self.assertEqual({evento['name'] for evento in eventos},
+                         {'entrada', 'izquierda', 'derecha', 'union', 'espera'})
+        self.assertGreaterEqual(min(evento['dur'] for evento in eventos if evento['name'] == 'izquierda'), 50_000)
+
+
+class Arreglo(Paso):
+    def _run(self, n) -> dict:
+        return {"arreglo": np.arange(n)}
+
+
+class Suma(Paso):
+    def _run(self, arreglo) -> dict:
+        return {"suma": int(arreglo.sum())}
+
+
+class Incremental(Proceso):
+    def __init__(self, cache_path, n):
+        super().__init__(True, cache_path)
+        self._n = n
+        self._arreglo = Arreglo("arreglo")
+        self._suma = Suma("suma", self._arreglo)
+
+    def arreglo(self, force_execution=False):
+        return self.run(self._arreglo, force_execution=force_execution, n=self._n)
+
+    def suma(self, force_execution=False):
+        return self.run(self._suma, force_execution=force_execution, n=self._n)
+
+
+class TestCacheIncremental(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self._path = Path(self._tmp.name).joinpath('incremental.pkl')
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def test_guarda_solo_respuestas_nuevas(self):
+        proceso = Incremental(self._path, 100_000)
+        proceso.arreglo()
+        archivos = list(proceso._cache_dir.iterdir())
+        self.assertEqual(len(archivos), 1)
+        self.assertLess(self._path.stat().st_size, 10_000)
+        modificado = archivos[0].stat().st_mtime_ns
+        proceso.suma()
+        self.assertEqual(len(list(proceso._cache_dir.iterdir())), 2)
+        self.assertEqual(archivos[0].stat().st_mtime_ns, modificado)
+        proceso.suma(force_execution=True)
+        self.assertEqual(len(list(proceso._cache_dir.iterdir())), 2)
+
+    def test_carga_perezosa(self):
+        Incremental(self._path, 100_000).suma()
+        proceso = Incremental.from_cache(Incremental(self._path, 100_000), True, self._path)
+        self.assertIsNone(proceso._arreglo._respuesta)
+        self.assertEqual(proceso.suma()['suma'], sum(range(100_000)))
+        self.assertIsNone(proceso._arreglo._respuesta)
+        self.assertIsInstance(proceso.arreglo()['arreglo'], np.memmap)
+        proceso.clean_cache()
+        self.assertFalse(proceso._cache_dir.exists())
+
+
+class Cuadrado(PasoParticionado):
+    def _run(self, entrada) -> dict:
+        ejecuciones[self._nombre] += 1
+        if (entrada < 0).any():
+            raise ValueError("Valores negativos")
+        return {"cuadrado": entrada ** 2, "filas": len(entrada)}
+
+
+class Normalizar(PasoParticionado):
+    def _run(self, entrada) -> dict:
+        return {"normalizado": entrada["valor"] / entrada.groupby("cliente")["valor"].transform("sum")}
+
+
+class Filas(PasoParticionado):
+    async def _run(self, entrada) -> dict:
+        await asyncio.sleep(0)
+        return {"filas": [len(entrada)]}
+
+
+class TestPasoParticionado(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self._cache = Path(self._tmp.name)
+        ejecuciones.clear()
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def test_particiones_por_filas(self):
+        cuadrado = Cuadrado("cuadrado", Entrada("entrada"), filas=300, max_workers=2)
+        respuesta = cuadrado.run(a=np.arange(1_000))
+        np.testing.assert_array_equal(respuesta["cuadrado"], np.arange(1_000) ** 2)
+        self.assertEqual(respuesta["filas"], 1_000)
+
+    def test_particiones_por_llave(self):
+        datos = pd.DataFrame({"cliente": np.arange(1_000) % 7, "valor": np.arange(1_000) + 1.0})
+        normalizar = Normalizar("normalizar", Entrada("entrada"), por="cliente", particiones=3, max_workers=2)
+        normalizado = normalizar.run(a=datos)["normalizado"]
+        pd.testing.assert_series_equal(normalizado, datos["valor"] / datos.groupby("cliente")["valor"].transform("sum"))
+
+    def test_particiones_async(self):
+        filas = Filas("filas", Entrada("entrada"), filas=10, procesos=False)
+        self.assertEqual(asyncio.run(filas.run_async(a=np.arange(35)))["filas"], [10, 10, 10, 5])
+
+    def test_cache_por_particion(self):
+        datos = np.arange(1_000)
+        datos[950] = -1
+        cuadrado = Cuadrado("cuadrado", Entrada("entrada"), filas=100, procesos=False, cache=self._cache)
+        with self.assertRaises(ValueError):
+            cuadrado.run(a=datos)
+        self.assertEqual(ejecuciones["cuadrado"], 10)
+        datos[950] = 950
+        cuadrado = Cuadrado("cuadrado", Entrada("entrada"), filas=100, procesos=False, cache=self._cache)
+        np.testing.assert_array_equal(cuadrado.run(a=datos)["cuadrado"], np.arange(1_000) ** 2)
+        self.assertEqual(ejecuciones["cuadrado"], 11)
+
+
+class Interrupcion(Exception):
+    pass
+
+
+interrupciones = set()
+
+
+class Cuadrados(PasoIncremental):
+    def _run(self, entrada) -> dict:
+        for valor in entrada[self.avance:]:
+            if valor in interrupciones:
+                interrupciones.remove(valor)
+                raise Interrupcion
+            ejecuciones[valor] += 1
+            yield {"cuadrados": [valor ** 2], "mayor": {valor: valor ** 2}}
+
+
+class Reanudable(Proceso):
+    def __init__(self, cache_path):
+        super().__init__(True, cache_path)
+        self._entrada = Entrada("entrada")
+        self._cuadrados = Cuadrados("cuadrados", self._entrada)
+
+    def cuadrados(self):
+        return self.run(self._cuadrados, a=list(range(6)))
+
+
+class TestPasoIncremental(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self._path = Path(self._tmp.name).joinpath('reanudable.pkl')
+        ejecuciones.clear()
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def test_reanuda_desde_from_cache(self):
+        interrupciones.add(4)
+        with self.assertRaises(Interrupcion):
+            Reanudable(self._path).cuadrados()
+        avances = self._path.with_name('reanudable_pasos').joinpath('avances')
+        self.assertEqual(len(list(avances.rglob('*.joblib'))), 4)
+        proceso = Reanudable.from_cache(Reanudable(self._path), True, self._path)
+        respuesta = proceso.cuadrados()
+        self.assertEqual(respuesta["cuadrados"], [valor ** 2 for valor in range(6)])
+        self.assertEqual(respuesta["mayor"][5], 25)
+        self.assertEqual(proceso._cuadrados.avance, 0)
+        self.assertEqual(ejecuciones, Counter({valor: 1 for valor in range(6)}, entrada=1))
+        self.assertFalse(any(avances.iterdir()))
+
+    def test_reanuda_con_cache_store(self):
+        cache = Path(self._tmp.name).joinpath('cache')
+        interrupciones.add(2)
+        with self.assertRaises(Interrupcion):
+            Cuadrados("cuadrados", Entrada("entrada"), cache=cache).run(a=list(range(4)))
+        cuadrados = Cuadrados("cuadrados", Entrada("entrada"), cache=cache)
+        self.assertEqual(cuadrados.run(a=list(range(4)))["cuadrados"], [0, 1, 4, 9])
+        self.assertEqual(ejecuciones, Counter({valor: 1 for valor in range(4)}, entrada=2))
+        self.assertEqual(list(cache.joinpath('avances').iterdir()), [])
+        sin_cache = Cuadrados("cuadrados", Entrada("entrada"))
+        self.assertEqual(sin_cache.run(a=[3])["cuadrados"], [9])
+
+
+class Doble(Paso):
+    def _run(self, arreglo) -> dict:
+        return {"arreglo": arreglo * 2}
+
+
+class TestLimiteMemoria(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self._path = Path(self._tmp.name).joinpath('limite.pkl')
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    @staticmethod
+    def cadena(largo=6):
+        pasos = [Arreglo("arreglo")]
+        for i in range(largo):
+            pasos.append(Doble(f"doble{i}", pasos[-1]))
+        return pasos
+
+    def test_libera_respuestas_consumidas(self):
+        pasos = self.cadena()
+        proceso = Proceso(memoria_maxima=2_500_000)
+        respuesta = proceso.run(pasos[-1], n=125_000)
+        np.testing.assert_array_equal(respuesta['arreglo'], np.arange(125_000) * 64)
+        self.assertLessEqual(proceso.limite_memoria.residentes(), 2_500_000)
+        self.assertIsNone(pasos[0]._respuesta)
+        np.testing.assert_array_equal(pasos[2].respuesta['arreglo'], np.arange(125_000) * 4)
+        carpeta = proceso.limite_memoria.carpeta
+        self.assertTrue(carpeta.exists())
+        del proceso
+        self.assertFalse(carpeta.exists())
+
+    def test_recarga_en_ejecucion(self):
+        pasos = self.cadena()
+        proceso = Proceso(cached=True, cache_path=self._path, memoria_maxima=1_000_000,
+                          planificador=Planificador(max_workers=2))
+        proceso.pasos = pasos
+        proceso.run(pasos[3], n=125_000)
+        self.assertIsNone(pasos[3]._respuesta)
+        ruta = pasos[3]._ruta_respuesta
+        self.assertEqual(ruta.parent, proceso._cache_dir)
+        respuesta = proceso.run(pasos[-1], n=125_000)
+        np.testing.assert_array_equal(respuesta['arreglo'], np.arange(125_000) * 64)
+        self.assertEqual(pasos[3]._ruta_respuesta, ruta)
+        self.assertEqual(len(list(proceso._cache_dir.iterdir())), len(pasos))
+
+    def test_pasos_fuera_del_proceso(self):
+        pasos = self.cadena()
+        proceso = Proceso(cached=True, cache_path=self._path, memoria_maxima=1_000_000)
+        respuesta = proceso.run(pasos[-1], n=125_000)
+        np.testing.assert_array_equal(respuesta['arreglo'], np.arange(125_000) * 64)
+        for numero, paso in enumerate(pasos):
+            np.testing.assert_array_equal(paso.respuesta['arreglo'], np.arange(125_000) * 2 ** numero)
+
+
 class MyTestCase(unittest.TestCase):
     def setUp(self) -> None:
         self._path = Path(r'cache/procesamiento.pkl').resolve().absolute()